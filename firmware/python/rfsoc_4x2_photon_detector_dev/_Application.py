@@ -8,38 +8,68 @@
 # contained in the LICENSE.txt file.
 #-----------------------------------------------------------------------------
 
+import time
+import threading
+import concurrent.futures
+
 import pyrogue as pr
 
 import axi_soc_ultra_plus_core.rfsoc_utility as rfsoc_utility
 import rfsoc_4x2_photon_detector_dev as rfsoc
 
 class Application(pr.Device):
-    def __init__(self,top_level='',**kwargs):
+    def __init__(self,top_level='',numCh=1,instrumentation=None,sipmLibrary='config/SipmWave8GSPS.wlib',sipmCsv='config/SipmWave8GSPS.csv',**kwargs):
         super().__init__(**kwargs)
 
+        self._numCh      = numCh
+        self._burstStats = rfsoc.Instrumentation.getStage(instrumentation, 'WaveformBurst')
+        self._resetStats = rfsoc.Instrumentation.getStage(instrumentation, 'FsmReset')
+
         self.add(rfsoc_utility.AppRingBuffer(
             offset   = 0x00_000000,
-            numAdcCh = 1, # Must match NUM_ADC_CH_G config
-            numDacCh = 1, # Must match NUM_DAC_CH_G config
+            numAdcCh = numCh, # Must match NUM_ADC_CH_G config
+            numDacCh = numCh, # Must match NUM_DAC_CH_G config
             # expand   = True,
         ))
 
         self.add(rfsoc_utility.SigGen(
             name         = 'DacSigGen',
             offset       = 0x01_000000,
-            numCh        = 1,  # Must match NUM_CH_G config
+            numCh        = numCh, # Must match NUM_CH_G config
             ramWidth     = 9,  # Must match RAM_ADDR_WIDTH_G config
             smplPerCycle = 16, # Must match SAMPLE_PER_CYCLE_G config
             # expand       = True,
         ))
 
-        self.add(rfsoc.SigGenLoader(
-            name      = 'SigGenLoader',
-            DacSigGen = self.DacSigGen,
-            top_level = top_level,
-            expand    = True,
+        # Dedicated worker for the asynchronous commands (keeps the ZMQ/poll threads free)
+        self.add(rfsoc.CommandWorker(
+            name = 'CommandWorker',
         ))
 
+        # Serializes the waveform loads and the DAC triggers of all the trigger sources
+        self._burstLock = threading.Lock()
+
+        # Independent waveform loader (and waveform parameters) per DAC channel. A single channel
+        # keeps the plain SigGenLoader name (same variable paths, PVs and YAML keys as before)
+        self.sigGenLoaders = []
+        for i in range(numCh):
+            self.sigGenLoaders.append(rfsoc.SigGenLoader(
+                name            = 'SigGenLoader' if numCh == 1 else f'SigGenLoader[{i}]',
+                DacSigGen       = self.DacSigGen,
+                ch              = i,
+                top_level       = top_level,
+                sipmLibrary     = sipmLibrary,
+                sipmCsv         = sipmCsv,
+                instrumentation = instrumentation,
+                worker          = self.CommandWorker,
+                lock            = self._burstLock,
+                expand          = (i==0),
+            ))
+            self.add(self.sigGenLoaders[i])
+
+        # Channel loads run concurrently
+        self._loadPool = concurrent.futures.ThreadPoolExecutor(max_workers=numCh, thread_name_prefix='SigGenLoader')
+
         self.add(pr.RemoteVariable(
             name         = 'StartDacFlag',
             offset       = 0x02_000100,
@@ -58,15 +88,57 @@ class Application(pr.Device):
         @self.command(description  = 'Force a DAC signal generator trigger from software')
         def getWaveformBurst():
             if self.EnableSoftTrig.get():
-                self.SigGenLoader.LoadWaveform()
-                self.StartDacFlag.set(1)
-                self.StartDacFlag.set(0)
+                start = time.perf_counter()
+                with self._burstLock:
+                    self._loadWaveforms()
+                    self.startDac()
+                self._burstStats.record(time.perf_counter()-start)
 
-        self.add(pr.LocalVariable(
-            name         = 'GetWaveformBurst',
-            mode         = 'RO',
-            localGet     = self.getWaveformBurst,
-            pollInterval = 1,
-            hidden       = True,
+        @self.command(description='Queue a getWaveformBurst on the command worker and return its job id')
+        def getWaveformBurstAsync():
+            return self.CommandWorker.submit('getWaveformBurst', self.getWaveformBurst)
+
+        self.add(rfsoc.TriggerScheduler(
+            name    = 'TriggerScheduler',
+            trigger = self.getWaveformBurst,
+            rate    = 1.0,
+            expand  = True,
+        ))
+
+        self.add(rfsoc.ScanEngine(
+            name      = 'ScanEngine',
+            loaders   = self.sigGenLoaders,
+            trigger   = self.startDac,
+            reset     = self.resetDac,
+            lock      = self._burstLock,
+            scheduler = self.TriggerScheduler,
         ))
 
+    def startDac(self):
+        # Trigger the DAC signal generators with the loaded waveforms (remembered for the readback monitors)
+        for i in range(self._numCh):
+            self.sigGenLoaders[i].markTriggered()
+        self.StartDacFlag.set(1)
+        self.StartDacFlag.set(0)
+
+    def resetDac(self):
+        # The FSM reset is shared by all the channels: reset once after the last write
+        start = time.perf_counter()
+        self.DacSigGen.Reset()
+        self._resetStats.record(time.perf_counter()-start)
+
+    def loadWaveforms(self):
+        with self._burstLock:
+            self._loadWaveforms()
+
+    def _loadWaveforms(self):
+        # Must be called with the burst lock held
+        if self._numCh == 1:
+            self.sigGenLoaders[0].loadWaveform()
+            return
+
+        # Write every channel's waveform in parallel and wait for all of them
+        futures = [self._loadPool.submit(self.sigGenLoaders[i].loadWaveform, reset=False) for i in range(self._numCh)]
+        for future in futures:
+            future.result()
+        self.resetDac()
@@ -0,0 +1,261 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import time
+import queue
+import threading
+import concurrent.futures
+
+import rogue.interfaces.stream
+
+import pyrogue as pr
+
+import numpy as np
+
+import rfsoc_4x2_photon_detector_dev as rfsoc
+
+class _RecorderChannel(rogue.interfaces.stream.Slave):
+    def __init__(self, recorder, channel):
+        rogue.interfaces.stream.Slave.__init__(self)
+        self._recorder = recorder
+        self._channel  = channel
+
+    def _acceptFrame(self, frame):
+        # Nothing to copy while the recorder is closed (_push checks again under its lock)
+        if self._recorder._writes is None:
+            return
+
+        stamp = time.time()
+        with frame.lock():
+            size = frame.getPayload()
+            data = np.zeros(shape=(size+1) & ~0x1, dtype=np.uint8, order='C')
+            frame.read(data[:size], 0)
+        self._recorder._push(self._channel, stamp, size, data)
+
+class ChunkedRecorder(pr.Device):
+    def __init__(self,
+            chunkFrames  = 64,   # Number of frames of a channel compressed together
+            chunkTimeout = 1.0,  # Partial chunks older than this are written anyway (units of seconds)
+            codec        = None, # 'none', 'zlib', 'lz4' or 'zstd' (None: best installed)
+            workers      = 2,    # Number of compression threads
+            maxPending   = 64,   # Number of chunks waiting for compression before frames are dropped
+        **kwargs):
+        super().__init__(**kwargs)
+
+        self._chunkFrames  = chunkFrames
+        self._chunkTimeout = chunkTimeout
+        self._codec        = rfsoc.recordCodec(codec)
+        self._workers      = workers
+        self._maxPending   = maxPending
+        self._channels     = {}
+        self._lock         = threading.Lock()
+        self._pool         = None
+        self._writes       = None # Compression futures in submission order
+        self._writer       = None
+        self._dataFile     = None
+        self._idxFile      = None
+        self._pending      = {}   # channel: (first receive time, [(frame, chFrame, stamp, size, data)])
+        self._chFrames     = {}
+
+        # Frames and chunks written, frames dropped on a full queue, and the raw vs file bytes (compression ratio)
+        self._frames   = 0
+        self._chunks   = 0
+        self._dropped  = 0
+        self._rawBytes = 0
+        self._size     = 0
+
+        self.add(pr.LocalVariable(
+            name        = 'DataFile',
+            description = 'Record file name, the index is written next to it with an .idx suffix',
+            mode        = 'RW',
+            value       = '',
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'Codec',
+            mode        = 'RO',
+            value       = rfsoc.RecordCodecs[self._codec],
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'IsOpen',
+            mode         = 'RO',
+            value        = False,
+            localGet     = lambda: self._dataFile is not None,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'FrameCount',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._frames,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'ChunkCount',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._chunks,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'DroppedFrames',
+            description  = 'Frames dropped because the compression workers could not keep up',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._dropped,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'CurrentSize',
+            mode         = 'RO',
+            units        = 'Bytes',
+            value        = 0,
+            localGet     = lambda: self._size,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'CompressionRatio',
+            mode         = 'RO',
+            value        = 0.0,
+            disp         = '{:1.2f}',
+            localGet     = lambda: self._rawBytes/self._size if self._size > 0 else 0.0,
+            pollInterval = 1,
+        ))
+
+        @self.command(description='Open the record file')
+        def Open():
+            self.open(self.DataFile.value())
+
+        @self.command(description='Write the pending chunks and close the record file')
+        def Close():
+            self.close()
+
+    def getChannel(self, channel):
+        # Same interface as StreamWriter.getChannel()
+        if channel not in self._channels:
+            self._channels[channel] = _RecorderChannel(self, channel)
+        return self._channels[channel]
+
+    def open(self, path):
+        self.close()
+        with self._lock:
+            self._dataFile = open(path, 'wb')
+            self._idxFile  = open(path+rfsoc.RecordIndexSuffix, 'wb')
+            self._pool     = concurrent.futures.ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='ChunkedRecorder')
+            self._writes   = queue.Queue()
+            self._pending  = {}
+            self._chFrames = {}
+            self._frames   = 0
+            self._chunks   = 0
+            self._dropped  = 0
+            self._rawBytes = 0
+            self._size     = 0
+            self._writer   = threading.Thread(target=self._runWriter, name='ChunkedRecorder.writer', daemon=True)
+            self._writer.start()
+
+    def close(self):
+        with self._lock:
+            if self._dataFile is None:
+                return
+            for channel in list(self._pending):
+                self._submit(channel)
+            writes, writer = self._writes, self._writer
+            self._writes = None
+
+        # Wait for the queued chunks to be written
+        writes.put(None)
+        writer.join()
+        self._pool.shutdown()
+
+        with self._lock:
+            self._dataFile.close()
+            self._idxFile.close()
+            self._dataFile = None
+            self._idxFile  = None
+            self._pool     = None
+            self._writer   = None
+
+    def _stop(self):
+        self.close()
+        super()._stop()
+
+    def _push(self, channel, stamp, size, data):
+        # Called from the stream threads: only buffers the frame, compression runs in the pool
+        with self._lock:
+            if self._writes is None:
+                return
+
+            chFrame = self._chFrames.get(channel, 0)
+            self._chFrames[channel] = chFrame+1
+
+            _, frames = self._pending.setdefault(channel, (stamp, []))
+            frames.append((self._frames, chFrame, stamp, size, data))
+            self._frames += 1
+
+            if len(frames) >= self._chunkFrames:
+                self._submit(channel)
+
+    def _submit(self, channel):
+        # Must be called with the lock held
+        _, frames = self._pending.pop(channel)
+        if self._writes.qsize() >= self._maxPending:
+            self._dropped += len(frames)
+            return
+        future = self._pool.submit(rfsoc.encodeChunk, self._codec, channel, [f[4] for f in frames])
+        self._writes.put((channel, frames, future))
+
+    def _flushStale(self):
+        now = time.time()
+        with self._lock:
+            if self._writes is None:
+                return
+            for channel, (first, _) in list(self._pending.items()):
+                if now-first > self._chunkTimeout:
+                    self._submit(channel)
+
+    def _runWriter(self):
+        writes = self._writes
+        while True:
+            try:
+                item = writes.get(timeout=min(0.1, self._chunkTimeout))
+            except queue.Empty:
+                self._flushStale()
+                continue
+            if item is None:
+                return
+
+            # Chunks are written in submission order, the index after its chunk is on disk
+            channel, frames, future = item
+            chunk  = future.result()
+            offset = self._dataFile.tell()
+            self._dataFile.write(chunk)
+            self._dataFile.flush()
+
+            index = np.zeros(len(frames), dtype=rfsoc.RecordIndexEntry)
+            index['frame']     = [f[0] for f in frames]
+            index['chFrame']   = [f[1] for f in frames]
+            index['timestamp'] = [f[2] for f in frames]
+            index['channel']   = channel
+            index['size']      = [f[3] for f in frames]
+            index['chunk']     = offset
+            index['offset']    = np.cumsum([0]+[f[4].size for f in frames[:-1]])
+            index.tofile(self._idxFile)
+            self._idxFile.flush()
+
+            self._chunks   += 1
+            self._rawBytes += sum(f[4].size for f in frames)
+            self._size      = offset+len(chunk)
+            self._flushStale()
@@ -0,0 +1,197 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import time
+import threading
+import collections
+
+import pyrogue as pr
+
+class CommandWorker(pr.Device):
+    def __init__(self,
+            history = 256, # Number of finished jobs whose status is kept
+        **kwargs):
+        super().__init__(**kwargs)
+
+        self._history = history
+        self._cond    = threading.Condition()
+        self._queue   = collections.OrderedDict() # key: (job id, function), in submission order
+        self._jobs    = collections.OrderedDict() # job id: state
+        self._nextId  = 1
+        self._thread  = None
+        self._running = False
+
+        # Job outcomes, and the id of the last submitted job
+        self._completed = 0
+        self._coalesced = 0
+        self._failed    = 0
+        self._lastJob   = 0
+        self._lastDone  = 0
+        self._lastError = ''
+        self._duration  = 0.0
+
+        self.add(pr.LocalVariable(
+            name         = 'LastSubmitted',
+            description  = 'Job id returned by the last asynchronous command',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._lastJob,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'LastCompleted',
+            description  = 'Job id of the last finished job',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._lastDone,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'Status',
+            description  = 'State of the last submitted job',
+            mode         = 'RO',
+            value        = 'Unknown',
+            localGet     = lambda: self.status(self._lastJob),
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'Pending',
+            description  = 'Number of jobs waiting for the worker',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: len(self._queue),
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'Completed',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._completed,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'Coalesced',
+            description  = 'Requests merged into an identical pending job',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._coalesced,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'Failed',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._failed,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'LastError',
+            mode         = 'RO',
+            value        = '',
+            localGet     = lambda: self._lastError,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'LastDuration',
+            description  = 'Execution time of the last finished job',
+            mode         = 'RO',
+            units        = 'seconds',
+            value        = 0.0,
+            disp         = '{:1.3e}',
+            localGet     = lambda: self._duration,
+            pollInterval = 1,
+        ))
+
+        @self.command(value=0, description='Return the state of a job id')
+        def JobStatus(arg):
+            return self.status(arg)
+
+    def submit(self, key, function):
+        # Queue function, a pending job with the same key runs the latest function instead
+        # Job states: Pending, Running, Done, Failed (Unknown once out of the history)
+        with self._cond:
+            if key in self._queue:
+                jobId = self._queue[key][0]
+                self._queue[key] = (jobId, function)
+                self._coalesced += 1
+            else:
+                jobId = self._nextId
+                self._nextId += 1
+                self._queue[key] = (jobId, function)
+                self._setState(jobId, 'Pending')
+                self._cond.notify_all()
+            self._lastJob = jobId
+            return jobId
+
+    def status(self, jobId):
+        with self._cond:
+            return self._jobs.get(int(jobId), 'Unknown')
+
+    def wait(self, jobId, timeout=None):
+        # Wait for a job to finish, returns its state
+        with self._cond:
+            self._cond.wait_for(lambda: self._jobs.get(jobId, 'Unknown') not in ['Pending', 'Running'], timeout=timeout)
+            return self._jobs.get(jobId, 'Unknown')
+
+    def _setState(self, jobId, state):
+        # Must be called with the condition held
+        self._jobs[jobId] = state
+        self._jobs.move_to_end(jobId)
+        while len(self._jobs) > self._history:
+            self._jobs.popitem(last=False)
+
+    def _start(self):
+        super()._start()
+        self._running = True
+        self._thread  = threading.Thread(target=self._run, name=f'{self.path}.worker', daemon=True)
+        self._thread.start()
+
+    def _stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        super()._stop()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: (not self._running) or len(self._queue) > 0)
+                if not self._running:
+                    return
+                _, (jobId, function) = self._queue.popitem(last=False)
+                self._setState(jobId, 'Running')
+
+            start = time.perf_counter()
+            try:
+                function()
+                state = 'Done'
+            except Exception as e:
+                self._log.exception(f'Job {jobId} failed')
+                self._lastError = f'Job {jobId}: {e}'
+                self._failed   += 1
+                state = 'Failed'
+
+            with self._cond:
+                self._duration   = time.perf_counter()-start
+                self._completed += 1
+                self._lastDone   = jobId
+                self._setState(jobId, state)
+                self._cond.notify_all()
@@ -0,0 +1,23 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import numpy as np
+
+class FrameBuffer(object):
+    # Preallocated frame buffer: frames are read in place without allocating per frame
+    def __init__(self, maxSize):
+        self._raw = np.zeros(shape=2*maxSize, dtype=np.uint8, order='C') # maxSize int16 samples
+
+    def read(self, frame):
+        # Copy the payload (truncated to the buffer) and view it as int16 samples. The view is
+        # only valid until the next read, and the caller holds the frame lock if it needs one
+        size = min(frame.getPayload(), self._raw.size) & ~0x1
+        frame.read(self._raw[:size], 0)
+        return self._raw[:size].view(np.int16)
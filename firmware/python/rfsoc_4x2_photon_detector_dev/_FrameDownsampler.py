@@ -0,0 +1,169 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import time
+import threading
+
+import rogue.interfaces.stream
+
+import pyrogue as pr
+
+import numpy as np
+
+import rfsoc_4x2_photon_detector_dev as rfsoc
+
+def minMaxDecimate(wave, factor):
+    # Keep the min and the max of every block of factor samples, in their original order,
+    # so narrow pulses and glitches survive the decimation
+    blocks = wave[:(wave.size//factor)*factor].reshape(-1, factor)
+    rows   = np.arange(blocks.shape[0])
+    iMin   = np.argmin(blocks, axis=1)
+    iMax   = np.argmax(blocks, axis=1)
+    lo     = blocks[rows, iMin]
+    hi     = blocks[rows, iMax]
+    order  = iMin <= iMax
+
+    out = np.empty(shape=2*blocks.shape[0], dtype=wave.dtype)
+    out[0::2] = np.where(order, lo, hi)
+    out[1::2] = np.where(order, hi, lo)
+    return out
+
+class FrameDownsampler(pr.Device, rogue.interfaces.stream.Slave, rogue.interfaces.stream.Master):
+    def __init__(self,
+            maxRate         = 1.0,     # Max forwarded frame rate (units of Hz, 0: no limit)
+            prescale        = 1,       # Keep one frame in prescale
+            threshold       = 0,       # Only keep frames with a pulse above threshold (units of counts, 0: keep all)
+            decimation      = 1,       # Min/max decimation factor of the samples (1: forward the frames untouched)
+            polarity        = 1,       # +1 for positive going pulses, -1 for negative going pulses
+            baselineSamples = 64,      # Number of samples at the end of the frame used for the baseline
+            maxSize         = 16*2**9, # Max number of int16 samples per frame
+        **kwargs):
+        pr.Device.__init__(self, **kwargs)
+        rogue.interfaces.stream.Slave.__init__(self)
+        rogue.interfaces.stream.Master.__init__(self)
+
+        if (decimation != 1) and (decimation < 2):
+            raise ValueError(f'decimation must be 1 or >= 2 (got {decimation})')
+
+        self._decimation = decimation
+        self._polarity   = polarity
+        self._nBase      = baselineSamples
+        self._lock       = threading.Lock()
+        self._lastSent   = 0.0
+        self._count      = 0
+        self._buffer     = rfsoc.FrameBuffer(maxSize)
+
+        # Frames seen by the gate and frames forwarded downstream
+        self._received = 0
+        self._sent     = 0
+
+        self.add(pr.LocalVariable(
+            name        = 'MaxRate',
+            description = 'Max forwarded frame rate (0 for no limit)',
+            mode        = 'RW',
+            units       = 'Hz',
+            value       = maxRate,
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'Prescale',
+            description = 'Keep one frame in Prescale',
+            mode        = 'RW',
+            value       = prescale,
+            minimum     = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'Threshold',
+            description = 'Only keep frames with a pulse above the threshold (0 to keep all)',
+            mode        = 'RW',
+            units       = 'Counts',
+            value       = threshold,
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'Decimation',
+            description = 'Min/max decimation factor of the forwarded samples',
+            mode        = 'RO',
+            value       = decimation,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'FramesIn',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._received,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'FramesOut',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._sent,
+            pollInterval = 1,
+        ))
+
+        @self.command(description='Clear the frame counters')
+        def CountReset():
+            with self._lock:
+                self._received = 0
+                self._sent     = 0
+
+    def outputRate(self, sampleRate):
+        # Sample rate of the forwarded frames (min/max pairs cover decimation samples)
+        return sampleRate if self._decimation == 1 else 2.0*sampleRate/self._decimation
+
+    def outputSize(self, size):
+        return size if self._decimation == 1 else 2*(size//self._decimation)
+
+    def _pulseAmplitude(self, wave):
+        nBase = max(1, min(self._nBase, wave.size))
+        base  = np.median(wave[-nBase:]) # Same tail baseline as the PulseAnalyzer
+        if self._polarity > 0:
+            return float(np.max(wave))-base
+        return base-float(np.min(wave))
+
+    def _acceptFrame(self, frame):
+        maxRate   = float(self.MaxRate.value())
+        prescale  = max(1, int(self.Prescale.value()))
+        threshold = float(self.Threshold.value())
+        now       = time.monotonic()
+
+        with self._lock:
+            self._received += 1
+            self._count    += 1
+
+            # Cheap checks first: the frame payload is only read when needed
+            if self._count < prescale:
+                return
+            if (maxRate > 0) and (now-self._lastSent < 1.0/maxRate):
+                return
+            self._count = 0
+
+            wave = None
+            if (threshold > 0) or (self._decimation != 1):
+                with frame.lock():
+                    wave = self._buffer.read(frame)
+
+                if (threshold > 0) and (self._pulseAmplitude(wave) < threshold):
+                    return
+
+            self._lastSent = now
+            self._sent    += 1
+
+            if self._decimation == 1:
+                out = frame
+            else:
+                data = minMaxDecimate(wave, self._decimation).view(np.uint8)
+                out  = self._reqFrame(data.size, True)
+                out.write(data, 0)
+
+        self._sendFrame(out)
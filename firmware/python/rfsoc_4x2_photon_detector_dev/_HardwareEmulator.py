@@ -0,0 +1,232 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import time
+import queue
+import threading
+
+import rogue
+import rogue.interfaces.memory
+import rogue.interfaces.stream
+
+import pyrogue as pr
+
+import numpy as np
+
+def nodeAddress(node):
+    # Absolute address of a remote variable or device: sum of the offsets up to the root
+    address = 0
+    while (node is not None) and not isinstance(node, pr.Root):
+        address += node.offset
+        node = node.parent
+    return address
+
+def bitAddress(var):
+    # (32-bit word address, bit mask) of a single bit remote variable
+    word, bit = divmod(var.bitOffset[0], 32)
+    return nodeAddress(var)+4*word, (0x1 << bit)
+
+class MemoryEmulator(rogue.interfaces.memory.Slave):
+    def __init__(self, pageSize=4096):
+        rogue.interfaces.memory.Slave.__init__(self, 4, 0x100000)
+        self._pageSize = pageSize
+        self._pages    = {}
+        self._hooks    = []
+        self._lock     = threading.Lock()
+
+    def addWriteHook(self, address, size, callback):
+        # callback(address, data) is called after any write overlapping [address, address+size)
+        self._hooks.append((address, size, callback))
+
+    def _spans(self, address, size):
+        # Split an access into (page, pageOffset, dataOffset, length) pieces
+        pos = 0
+        while pos < size:
+            page, offset = divmod(address+pos, self._pageSize)
+            length = min(size-pos, self._pageSize-offset)
+            yield page, offset, pos, length
+            pos += length
+
+    def read(self, address, size):
+        data = np.zeros(shape=size, dtype=np.uint8, order='C')
+        with self._lock:
+            for page, offset, pos, length in self._spans(address, size):
+                if page in self._pages:
+                    data[pos:pos+length] = self._pages[page][offset:offset+length]
+        return data
+
+    def write(self, address, data):
+        data = np.frombuffer(data, dtype=np.uint8)
+        with self._lock:
+            for page, offset, pos, length in self._spans(address, data.size):
+                if page not in self._pages:
+                    self._pages[page] = np.zeros(shape=self._pageSize, dtype=np.uint8, order='C')
+                self._pages[page][offset:offset+length] = data[pos:pos+length]
+
+        for hookAddr, hookSize, callback in self._hooks:
+            if (address < hookAddr+hookSize) and (hookAddr < address+data.size):
+                callback(address, data)
+
+    def _doTransaction(self, transaction):
+        address = transaction.address()
+        size    = transaction.size()
+        type    = transaction.type()
+
+        if (type == rogue.interfaces.memory.Write) or (type == rogue.interfaces.memory.Post):
+            data = bytearray(size)
+            transaction.getData(data, 0)
+            self.write(address, data)
+        else:
+            transaction.setData(bytearray(self.read(address, size)), 0)
+
+        transaction.done()
+
+class FrameSource(rogue.interfaces.stream.Master):
+    def __init__(self):
+        rogue.interfaces.stream.Master.__init__(self)
+
+    def sendSamples(self, samples):
+        data  = np.ascontiguousarray(samples, dtype=np.int16).view(np.uint8)
+        frame = self._reqFrame(data.size, True)
+        frame.write(data, 0)
+        self._sendFrame(frame)
+
+class HardwareEmulator(object):
+    def __init__(self,
+            host         = '127.0.0.1',
+            numCh        = 1,         # Number of ADC/DAC channels
+            memPort      = 9000,      # Register access (ports memPort & memPort+1)
+            adcPort      = 10000,     # ADC ring buffer stream of channel i (ports adcPort+2*i & adcPort+2*i+1)
+            dacPort      = 10032,     # DAC ring buffer stream of channel i (ports dacPort+2*i & dacPort+2*i+1)
+            dacSamples   = 16*2**9,   # Number of DAC samples per ring buffer frame
+            decimation   = 4,         # DAC/ADC sample rate ratio (8.128 GSPS / 2.032 GSPS)
+            noise        = 8.0,       # ADC noise RMS (units of counts)
+            frameRate    = 0.0,       # Free running ring buffer frame rate (units of Hz, 0: only on StartDacFlag)
+            dspResetTime = 0.1,       # Time DspReset stays asserted after start (units of seconds)
+        ):
+
+        self.frameRate    = frameRate
+        self.noise        = noise
+        self.triggerCount = 0
+        self.frameCount   = 0
+
+        self._numCh        = numCh
+        self._dacSamples   = dacSamples
+        self._decimation   = decimation
+        self._dspResetTime = dspResetTime
+        self._rng          = np.random.default_rng()
+        self._triggers     = queue.Queue()
+        self._threads      = []
+        self._running      = False
+        self._waveAddr     = []
+        self._flagAddr     = None
+        self._flagMask     = None
+        self._dspAddr      = None
+        self._dspMask      = None
+
+        # Register access server
+        self.memory     = MemoryEmulator()
+        self._memServer = rogue.interfaces.memory.TcpServer(host, memPort)
+        pr.busConnect(self._memServer, self.memory)
+
+        # ADC/DAC ring buffer stream servers
+        self._adcSource = [FrameSource() for i in range(numCh)]
+        self._dacSource = [FrameSource() for i in range(numCh)]
+        self._adcServer = [rogue.interfaces.stream.TcpServer(host, adcPort+2*i) for i in range(numCh)]
+        self._dacServer = [rogue.interfaces.stream.TcpServer(host, dacPort+2*i) for i in range(numCh)]
+        for i in range(numCh):
+            self._adcSource[i] >> self._adcServer[i]
+            self._dacSource[i] >> self._dacServer[i]
+
+    def attach(self, rfsoc):
+        # Resolve the emulated registers from the RFSoC device tree
+        app  = rfsoc.Application
+        flag = app.StartDacFlag
+        dsp  = rfsoc.AxiSocCore.AxiVersion.DspReset
+
+        self._waveAddr = [nodeAddress(app.DacSigGen.Waveform[i]) for i in range(self._numCh)]
+        self._flagAddr, self._flagMask = bitAddress(flag)
+        self._dspAddr,  self._dspMask  = bitAddress(dsp)
+
+        self.memory.addWriteHook(self._flagAddr, 4, self._startDacFlag)
+
+    def _start(self):
+        self._running = True
+
+        # Hold the DSP clock in reset for a while like the RFSoC does after configuration
+        if self._dspAddr is not None:
+            self._setBits(self._dspAddr, self._dspMask, True)
+            timer = threading.Timer(self._dspResetTime, self._setBits, args=(self._dspAddr, self._dspMask, False))
+            timer.daemon = True
+            timer.start()
+            self._threads.append(timer)
+
+        for target, name in [(self._runTrigger, 'trigger'), (self._runFreeRunning, 'freeRunning')]:
+            thread = threading.Thread(target=target, name=f'HardwareEmulator.{name}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _stop(self):
+        self._running = False
+        self._triggers.put(None)
+        for thread in self._threads:
+            if isinstance(thread, threading.Timer):
+                thread.cancel()
+            thread.join()
+        self._threads = []
+
+    def _setBits(self, address, mask, value):
+        word = self.memory.read(address, 4).view(np.uint32)
+        word[0] = (word[0] | mask) if value else (word[0] & (~mask & 0xFFFFFFFF))
+        self.memory.write(address, word.view(np.uint8))
+
+    def _startDacFlag(self, address, data):
+        # Trigger the signal generator on a StartDacFlag write with the flag bit set
+        word = self.memory.read(self._flagAddr, 4).view(np.uint32)[0]
+        if word & self._flagMask:
+            self._triggers.put(True)
+
+    def dacWaveform(self, ch=0):
+        return self.memory.read(self._waveAddr[ch], 2*self._dacSamples).view(np.int16)
+
+    def adcWaveform(self, dac):
+        # Loopback model: DAC waveform sampled at the ADC rate plus gaussian noise
+        adc = dac[::self._decimation].astype(np.float64)
+        if self.noise > 0:
+            adc += self._rng.normal(0.0, self.noise, size=adc.size)
+        return np.clip(np.rint(adc), -32768, 32767).astype(np.int16)
+
+    def sendFrames(self):
+        # StartDacFlag is common to all the channels
+        for i in range(self._numCh):
+            dac = self.dacWaveform(i)
+            self._dacSource[i].sendSamples(dac)
+            self._adcSource[i].sendSamples(self.adcWaveform(dac))
+        self.frameCount += 1
+
+    def _runTrigger(self):
+        while self._triggers.get() is not None:
+            self.triggerCount += 1
+            self.sendFrames()
+
+    def _runFreeRunning(self):
+        deadline = time.monotonic()
+        while self._running:
+            if self.frameRate <= 0:
+                deadline = time.monotonic()
+                time.sleep(0.1)
+                continue
+
+            # Emit the loaded waveform at the frame rate, without bursting after a stall
+            deadline = max(deadline + 1.0/self.frameRate, time.monotonic())
+            delay = deadline-time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.sendFrames()
@@ -0,0 +1,178 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import time
+import threading
+
+import pyrogue as pr
+
+class IncrementalReader(pr.Device):
+    def __init__(self, staleTimeout=0.0, **kwargs):
+        super().__init__(**kwargs)
+
+        self._lock     = threading.Lock()
+        self._dirty    = {} # path: (device, recurse)
+        self._lastRead = {} # path: time of the last read of the device blocks
+
+        # ReadDirty transactions and the variables they did not need to read
+        self._reads     = 0
+        self._lastTran  = 0
+        self._lastSaved = 0
+        self._saved     = 0
+
+        self.add(pr.LocalVariable(
+            name        = 'StaleTimeout',
+            description = 'Devices not read for this long are refreshed by ReadDirty (0 to disable)',
+            mode        = 'RW',
+            units       = 'seconds',
+            value       = staleTimeout,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'DirtyDevices',
+            description  = 'Number of devices written since their last read',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: len(self._dirty),
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'ReadCount',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._reads,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'LastTransactions',
+            description  = 'Number of block transactions issued by the last incremental read',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._lastTran,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'LastSaved',
+            description  = 'Number of block transactions the last incremental read saved compared to ReadAll',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._lastSaved,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'TotalSaved',
+            description  = 'Number of block transactions saved by all incremental reads compared to ReadAll',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._saved,
+            pollInterval = 1,
+        ))
+
+        @self.command(description='Read only the devices written since their last read (and the stale ones)')
+        def ReadDirty():
+            self.readDirty()
+
+    @staticmethod
+    def _blockCount(device, recurse):
+        # Number of remote block transactions needed to read a device
+        count = sum(1 for b in device._blocks if not isinstance(b, pr.LocalBlock))
+        if recurse:
+            count += sum(IncrementalReader._blockCount(d, True) for d in device.devices.values())
+        return count
+
+    def _deviceList(self, device=None):
+        device = self.root if device is None else device
+        devices = [device]
+        for d in device.devices.values():
+            devices.extend(self._deviceList(d))
+        return devices
+
+    def markDirty(self, node, recurse=False):
+        # Variables dirty their parent device
+        device = node if isinstance(node, pr.Device) else node.parent
+        with self._lock:
+            prev = self._dirty.get(device.path)
+            self._dirty[device.path] = (device, recurse or (prev is not None and prev[1]))
+
+    def markYaml(self, data, node=None):
+        # Mark the devices touched by a configuration dictionary
+        node = self.root if node is None else node
+        for key, value in data.items():
+            if key == node.name and node is self.root:
+                self.markYaml(value, node)
+                continue
+            for match in node.nodeMatch(key):
+                if isinstance(match, pr.Device):
+                    if isinstance(value, dict):
+                        self.markYaml(value, match)
+                    else:
+                        self.markDirty(match)
+                else:
+                    self.markDirty(match)
+
+    def loadConfig(self, path):
+        # LoadConfig that remembers which devices the YAML file touched
+        for name in (path if isinstance(path, list) else [path]):
+            self.markYaml(pr.yamlToData(fName=name))
+        self.root.LoadConfig(path)
+
+    def readAll(self):
+        # Devices marked dirty while the read is in progress stay dirty
+        with self._lock:
+            covered = set(self._dirty)
+
+        self.root.ReadAll()
+
+        now = time.monotonic()
+        with self._lock:
+            for path in covered:
+                self._dirty.pop(path, None)
+            for device in self._deviceList():
+                self._lastRead[device.path] = now
+
+    def readDirty(self):
+        stale = float(self.StaleTimeout.value())
+        now   = time.monotonic()
+
+        with self._lock:
+            targets = dict(self._dirty)
+            self._dirty.clear()
+
+        # Add the devices that have not been read for longer than the stale timeout
+        if stale > 0:
+            for device in self._deviceList():
+                if (device.path not in targets) and (now-self._lastRead.get(device.path, 0.0) > stale):
+                    targets[device.path] = (device, False)
+
+        # Skip devices already covered by a recursive read of an ancestor
+        recursive = [p for p, (_, r) in targets.items() if r]
+        targets   = {p: t for p, t in targets.items() if not any(p.startswith(f'{r}.') for r in recursive)}
+
+        for device, recurse in targets.values():
+            device.readBlocks(recurse=recurse)
+        for device, recurse in targets.values():
+            device.checkBlocks(recurse=recurse)
+
+        now = time.monotonic()
+        for device, recurse in targets.values():
+            for d in (self._deviceList(device) if recurse else [device]):
+                self._lastRead[d.path] = now
+
+        total = self._blockCount(self.root, True)
+        count = sum(self._blockCount(d, r) for d, r in targets.values())
+
+        self._reads    += 1
+        self._lastTran  = count
+        self._lastSaved = total-count
+        self._saved    += total-count
@@ -0,0 +1,247 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import sys
+import math
+import time
+import threading
+import collections
+
+import rogue.interfaces.stream
+
+import pyrogue as pr
+
+import numpy as np
+
+class LatencyStats(object):
+    # Log binned latency histogram: binsPerDecade bins per decade from minLatency up
+    def __init__(self, minLatency=1.0E-7, decades=8, binsPerDecade=16):
+        self._logMin = math.log10(minLatency)
+        self._perDec = binsPerDecade
+        self._bins   = decades*binsPerDecade
+        self._lock   = threading.Lock()
+        self.edges   = minLatency*10.0**(np.arange(self._bins+1)/binsPerDecade)
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._hist  = [0]*self._bins
+            self.count  = 0
+            self.bytes  = 0
+            self.total  = 0.0
+            self.last   = 0.0
+            self.max    = 0.0
+            self._rateSnap = (0, 0, time.monotonic())
+            self._rates    = (0.0, 0.0)
+
+    def record(self, latency, nbytes=0):
+        # Hot path: a log10 and a few integer updates under the lock
+        idx = int((math.log10(latency)-self._logMin)*self._perDec) if latency > 0 else 0
+        idx = min(max(idx, 0), self._bins-1)
+        with self._lock:
+            self._hist[idx] += 1
+            self.count += 1
+            self.bytes += nbytes
+            self.total += latency
+            self.last   = latency
+            if latency > self.max:
+                self.max = latency
+
+    def histogram(self):
+        with self._lock:
+            return np.array(self._hist, dtype=np.uint32)
+
+    def mean(self):
+        return self.total/self.count if self.count > 0 else 0.0
+
+    def percentile(self, q):
+        # Upper edge of the bin holding the q-th percentile
+        hist = self.histogram()
+        if hist.sum() == 0:
+            return 0.0
+        idx = int(np.searchsorted(np.cumsum(hist), q/100.0*hist.sum()))
+        return min(float(self.edges[idx+1]), self.max)
+
+    def rates(self):
+        # (events/s, bytes/s) since the previous call, at most refreshed once a second
+        now = time.monotonic()
+        with self._lock:
+            count, nbytes, t0 = self._rateSnap
+            if now-t0 >= 1.0:
+                self._rates    = ((self.count-count)/(now-t0), (self.bytes-nbytes)/(now-t0))
+                self._rateSnap = (self.count, self.bytes, now)
+            return self._rates
+
+class StageMonitor(pr.Device):
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+        for name, units, disp, get in [
+                ('Count',      '',        '{}',      lambda: self.stats.count),
+                ('Rate',       'Hz',      '{:1.1f}', lambda: self.stats.rates()[0]),
+                ('Throughput', 'Bytes/s', '{:1.3e}', lambda: self.stats.rates()[1]),
+                ('Last',       'seconds', '{:1.3e}', lambda: self.stats.last),
+                ('Mean',       'seconds', '{:1.3e}', lambda: self.stats.mean()),
+                ('P50',        'seconds', '{:1.3e}', lambda: self.stats.percentile(50)),
+                ('P99',        'seconds', '{:1.3e}', lambda: self.stats.percentile(99)),
+                ('Max',        'seconds', '{:1.3e}', lambda: self.stats.max),
+            ]:
+            self.add(pr.LocalVariable(
+                name         = name,
+                mode         = 'RO',
+                units        = units,
+                value        = 0 if name == 'Count' else 0.0,
+                disp         = disp,
+                localGet     = get,
+                pollInterval = 1,
+            ))
+
+        self.add(pr.LocalVariable(
+            name         = 'Histogram',
+            mode         = 'RO',
+            typeStr      = 'UInt32[np]',
+            value        = stats.histogram(),
+            localGet     = lambda: self.stats.histogram(),
+            pollInterval = 1,
+            hidden       = True,
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'HistogramBins',
+            description = 'Lower edge of the histogram bins',
+            mode        = 'RO',
+            typeStr     = 'Float[np]',
+            units       = 'seconds',
+            value       = stats.edges[:-1].astype(np.float32),
+            hidden      = True,
+        ))
+
+class TimingTap(rogue.interfaces.stream.Slave, rogue.interfaces.stream.Master):
+    # Pass-through stream filter: downstream slaves run in _sendFrame, so its duration is their frame handling time
+    def __init__(self, stats):
+        rogue.interfaces.stream.Slave.__init__(self)
+        rogue.interfaces.stream.Master.__init__(self)
+        self._stats = stats
+
+    def _acceptFrame(self, frame):
+        size  = frame.getPayload()
+        start = time.perf_counter()
+        self._sendFrame(frame)
+        self._stats.record(time.perf_counter()-start, size)
+
+class Instrumentation(pr.Device):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        self._profiler = None
+
+        self.add(pr.LocalVariable(
+            name        = 'ProfileDuration',
+            description = 'Duration of the sampling profiler run',
+            mode        = 'RW',
+            units       = 'seconds',
+            value       = 5.0,
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'ProfileInterval',
+            description = 'Sampling period of the thread stacks',
+            mode        = 'RW',
+            units       = 'seconds',
+            value       = 0.005,
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'ProfileFile',
+            description = 'Optional file for the collapsed stacks of the profile (flame graph input)',
+            mode        = 'RW',
+            value       = '',
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'Profiling',
+            mode         = 'RO',
+            value        = False,
+            localGet     = lambda: (self._profiler is not None) and self._profiler.is_alive(),
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'ProfileReport',
+            description = 'Functions with the most samples in the last profile',
+            mode        = 'RO',
+            value       = '',
+            hidden      = True,
+        ))
+
+        @self.command(description='Sample all the thread stacks for ProfileDuration in the background')
+        def ProfileDump():
+            if (self._profiler is None) or not self._profiler.is_alive():
+                self._profiler = threading.Thread(target=self._runProfile, name=f'{self.path}.profiler', daemon=True)
+                self._profiler.start()
+
+        @self.command(description='Clear the statistics of every stage')
+        def StatsReset():
+            for dev in self.devices.values():
+                dev.stats.reset()
+
+    def stage(self, name):
+        # Statistics of a timed stage, shared by every caller using the same name
+        if name not in self.devices:
+            self.add(StageMonitor(name=name, stats=LatencyStats()))
+        return self.devices[name].stats
+
+    @staticmethod
+    def getStage(instrumentation, name):
+        # Detached statistics when the tree has no instrumentation device
+        return LatencyStats() if instrumentation is None else instrumentation.stage(name)
+
+    def profile(self, duration, interval):
+        # Statistical profiler: periodic snapshots of the stack of every other thread
+        me      = threading.get_ident()
+        stacks  = collections.Counter()
+        own     = collections.Counter()
+        total   = collections.Counter()
+        samples = 0
+        stop    = time.monotonic()+duration
+
+        while time.monotonic() < stop:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(f'{frame.f_code.co_name} ({frame.f_code.co_filename}:{frame.f_code.co_firstlineno})')
+                    frame = frame.f_back
+                stack.reverse()
+                stacks[(names.get(ident, str(ident)),)+tuple(stack)] += 1
+                own[stack[-1]] += 1
+                for func in set(stack):
+                    total[func] += 1
+            samples += 1
+            time.sleep(interval)
+
+        return samples, stacks, own, total
+
+    def _runProfile(self):
+        samples, stacks, own, total = self.profile(float(self.ProfileDuration.value()), float(self.ProfileInterval.value()))
+
+        lines = [f'{samples} samples', f'{"Total":>7} {"Own":>7}  Function']
+        for func, count in total.most_common(40):
+            lines.append(f'{count:>7} {own[func]:>7}  {func}')
+        self.ProfileReport.set('\n'.join(lines))
+
+        path = self.ProfileFile.value()
+        if path != '':
+            with open(path, 'w') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f'{";".join(stack)} {count}\n')
@@ -0,0 +1,33 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import numpy as np
+
+class PhotonGenerator(object):
+    def __init__(self,
+            bufferLength = 16*2**9,  # Number of DAC samples per waveform
+            sampleRate   = 8.128E+9, # Units of Hz
+            seed         = None,     # Random generator seed (None: non-deterministic)
+        ):
+
+        self._duration = bufferLength/sampleRate
+        self._rng      = np.random.default_rng(seed)
+
+    def generate(self, rate, amplitude, amplitudeSigma, decay, rise, pileup=5.0):
+        # Poisson photon arrivals at rate (units of Hz) with gaussian amplitudes, as (A, B, C, T0) event arrays.
+        # Arrivals start pileup decay times before the buffer so that it begins with the steady state pileup
+        start = -pileup*decay if rate > 0 else 0.0
+        count = self._rng.poisson(rate*(self._duration-start))
+
+        A  = self._rng.normal(amplitude, amplitudeSigma, size=count) if amplitudeSigma > 0 else np.full(count, float(amplitude))
+        B  = np.full(count, float(decay))
+        C  = np.full(count, float(rise))
+        T0 = self._rng.uniform(start, self._duration, size=count)
+        return A, B, C, T0
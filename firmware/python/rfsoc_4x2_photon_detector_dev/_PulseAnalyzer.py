@@ -0,0 +1,229 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import threading
+
+import pyrogue as pr
+
+import numpy as np
+
+import rfsoc_4x2_photon_detector_dev as rfsoc
+
+# Pulse features kept for the rolling histograms: (name, units, default histogram range)
+PulseFeatures = [
+    ('Amplitude',   'Counts',          (0.0, 32768.0)),
+    ('ArrivalTime', 'seconds',         (0.0, 1.0E-6)),
+    ('RiseTime',    'seconds',         (0.0, 50.0E-9)),
+    ('DecayTime',   'seconds',         (0.0, 500.0E-9)),
+    ('Charge',      'Counts*seconds',  (0.0, 1.0E-3)),
+]
+
+class PulseAnalyzer(pr.DataReceiver):
+    def __init__(self,
+            sampleRate      = 2.032E+9, # Units of Hz
+            maxSize         = 4*2**9,   # Max number of int16 samples per frame
+            polarity        = 1,        # +1 for positive going pulses, -1 for negative going pulses
+            baselineSamples = 64,       # Number of samples at the end of the frame used for the baseline
+            threshold       = 200,      # Pulse detection threshold above baseline (units of counts)
+            cfdFraction     = 0.5,      # Constant fraction discriminator fraction of the peak
+            histDepth       = 10000,    # Number of pulses kept in the rolling histograms
+            histBins        = 128,      # Number of bins per histogram
+            histRanges      = None,     # Optional dict of {feature: (min,max)} histogram ranges
+        **kwargs):
+        super().__init__(**kwargs)
+
+        self._timeBin   = 1.0/sampleRate
+        self._maxSize   = maxSize
+        self._polarity  = polarity
+        self._histDepth = histDepth
+        self._histBins  = histBins
+        self._lock      = threading.Lock()
+
+        self._buffer    = rfsoc.FrameBuffer(maxSize)
+
+        # Rolling store of the features of the last histDepth pulses
+        self._ranges  = {name: rng for name, _, rng in PulseFeatures}
+        self._ranges.update(histRanges or {})
+        self._ring    = np.zeros(shape=(len(PulseFeatures), histDepth), dtype=np.float64, order='C')
+        self._ringIdx = 0
+        self._ringCnt = 0
+        self._last    = np.zeros(shape=len(PulseFeatures), dtype=np.float64, order='C')
+        self._pulses  = 0
+        self._base    = 0.0
+
+        self.add(pr.LocalVariable(
+            name        = 'BaselineSamples',
+            description = 'Number of samples at the end of the frame used for the baseline (the pulses start early in the frame)',
+            mode        = 'RW',
+            value       = baselineSamples,
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'Threshold',
+            description = 'Pulse detection threshold above the baseline',
+            mode        = 'RW',
+            units       = 'Counts',
+            value       = threshold,
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'CfdFraction',
+            description = 'Constant fraction discriminator fraction of the pulse peak',
+            mode        = 'RW',
+            value       = cfdFraction,
+            minimum     = 0.0,
+            maximum     = 1.0,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'Baseline',
+            mode         = 'RO',
+            units        = 'Counts',
+            value        = 0.0,
+            disp         = '{:1.1f}',
+            localGet     = lambda: self._base,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'PulseCount',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._pulses,
+            pollInterval = 1,
+        ))
+
+        for i, (name, units, _) in enumerate(PulseFeatures):
+
+            # Feature of the last pulse
+            self.add(pr.LocalVariable(
+                name         = name,
+                mode         = 'RO',
+                units        = units,
+                value        = 0.0,
+                disp         = '{:1.3e}',
+                localGet     = lambda i=i: float(self._last[i]),
+                pollInterval = 1,
+            ))
+
+            # Rolling histogram of the feature
+            self.add(pr.LocalVariable(
+                name         = f'{name}Hist',
+                mode         = 'RO',
+                typeStr      = 'UInt32[np]',
+                value        = np.zeros(shape=histBins, dtype=np.uint32, order='C'),
+                localGet     = lambda i=i, name=name: self._histogram(i, name),
+                pollInterval = 1,
+                hidden       = True,
+            ))
+
+            # Bin centers of the histogram
+            lo, hi = self._ranges[name]
+            self.add(pr.LocalVariable(
+                name    = f'{name}HistBins',
+                mode    = 'RO',
+                typeStr = 'Float[np]',
+                units   = units,
+                value   = (lo + (np.arange(histBins, dtype=np.float64)+0.5)*(hi-lo)/histBins).astype(np.float32),
+                hidden  = True,
+            ))
+
+        @self.command(description='Clear the rolling histograms')
+        def HistogramReset():
+            with self._lock:
+                self._ringIdx = 0
+                self._ringCnt = 0
+                self._pulses  = 0
+
+    def _histogram(self, i, name):
+        with self._lock:
+            data = self._ring[i,:self._ringCnt].copy()
+        hist, _ = np.histogram(data, bins=self._histBins, range=self._ranges[name])
+        return hist.astype(np.uint32)
+
+    def process(self, frame):
+        wave = self._buffer.read(frame)
+        features = self.analyze(wave)
+        if features.shape[1] == 0:
+            return
+
+        with self._lock:
+            for k in range(features.shape[1]):
+                self._ring[:,self._ringIdx] = features[:,k]
+                self._ringIdx = (self._ringIdx+1) % self._histDepth
+            self._ringCnt  = min(self._ringCnt+features.shape[1], self._histDepth)
+            self._pulses  += features.shape[1]
+            self._last[:]  = features[:,-1]
+
+    def analyze(self, wave):
+        nBase     = max(1, min(int(self.BaselineSamples.value()), wave.size))
+        threshold = float(self.Threshold.value())
+        fraction  = float(self.CfdFraction.value())
+
+        # Baseline subtracted signal with positive going pulses. The baseline comes from the tail of the
+        # frame: the first pulse (IncidentTime of 10 ns) already rises within the first 64 samples
+        self._base = float(np.median(wave[-nBase:]))
+        y = self._polarity*(wave.astype(np.float64)-self._base)
+
+        # Find the pulse segments with hysteresis: above half threshold and peaking above threshold
+        above  = np.concatenate(([False], y > 0.5*threshold, [False]))
+        edges  = np.flatnonzero(np.diff(above.view(np.int8)))
+        starts = edges[0::2]
+        stops  = edges[1::2]
+        if starts.size > 0:
+            keep   = np.maximum.reduceat(y, starts) > threshold
+            starts = starts[keep]
+            stops  = stops[keep]
+        if starts.size == 0:
+            return np.zeros(shape=(len(PulseFeatures), 0), dtype=np.float64)
+
+        # Split the frame between neighbouring pulses at the minimum between them
+        bounds = np.empty(starts.size+1, dtype=np.int64)
+        bounds[0]  = 0
+        bounds[-1] = y.size
+        for k in range(1, starts.size):
+            bounds[k] = stops[k-1] + np.argmin(y[stops[k-1]:starts[k]])
+
+        # Peak amplitude of every pulse and integrated charge (baseline subtracted) of its window
+        peaks  = np.maximum.reduceat(y, starts)
+        charge = np.add.reduceat(y, bounds[:-1])*self._timeBin
+
+        arrival = np.empty(starts.size)
+        rise    = np.empty(starts.size)
+        decay   = np.empty(starts.size)
+        for k in range(starts.size):
+            peakIdx    = starts[k] + np.argmax(y[starts[k]:stops[k]])
+            edge       = y[bounds[k]:peakIdx+1]
+            arrival[k] = (bounds[k] + self._crossing(edge, fraction*peaks[k]))*self._timeBin
+            rise[k]    = (self._crossing(edge, 0.9*peaks[k]) - self._crossing(edge, 0.1*peaks[k]))*self._timeBin
+            decay[k]   = self._decayTime(y[peakIdx:bounds[k+1]], peaks[k])
+
+        return np.vstack((peaks, arrival, rise, decay, charge))
+
+    @staticmethod
+    def _crossing(edge, level):
+        # Interpolated position of the last upward crossing of level on the leading edge
+        below = np.flatnonzero(edge < level)
+        if below.size == 0:
+            return 0.0
+        i = below[-1]
+        if i+1 >= edge.size:
+            return float(i)
+        return i + (level-edge[i])/(edge[i+1]-edge[i])
+
+    def _decayTime(self, tail, peak):
+        # Log-linear least squares fit of the falling edge down to 10% of the peak
+        stop = np.flatnonzero(tail < 0.1*peak)
+        tail = tail[:stop[0]] if stop.size else tail
+        if tail.size < 3:
+            return 0.0
+        x = np.arange(tail.size, dtype=np.float64)
+        slope = np.polyfit(x, np.log(tail), 1)[0]
+        return -self._timeBin/slope if slope < 0 else 0.0
@@ -0,0 +1,128 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import threading
+import collections
+
+import numpy as np
+
+class PulseSynthesizer(object):
+    def __init__(self,
+            bufferLength = 16*2**9,   # Number of DAC samples per waveform
+            sampleRate   = 8.128E+9,  # Units of Hz
+            cacheSize    = 16,        # Number of memoized waveforms
+            templates    = None,      # Optional PulseTemplateStore composing the pulses from cached templates
+        ):
+
+        self._bufferLength = bufferLength
+        self._smplRate     = sampleRate
+        self._timeBin      = (1.0/sampleRate)
+        self._cacheSize    = cacheSize
+        self._templates    = templates
+        self._cache        = collections.OrderedDict()
+        self._lock         = threading.Lock()
+        self.cacheHits     = 0
+        self.cacheMisses   = 0
+
+        # Time of each DAC sample, shared by every synthesis
+        self._time = np.arange(bufferLength, dtype=np.float64)*self._timeBin
+
+    @property
+    def bufferLength(self):
+        return self._bufferLength
+
+    @property
+    def sampleRate(self):
+        return self._smplRate
+
+    @property
+    def templates(self):
+        return self._templates
+
+    @staticmethod
+    def _key(*params):
+        return tuple((p.dtype.str, p.shape, p.tobytes()) for p in params)
+
+    def clearCache(self):
+        with self._lock:
+            self._cache.clear()
+
+    def compute(self, amplitude, decay, rise, incidentTime):
+
+        # Normalize the photon parameters to 1-D numpy arrays
+        A  = np.ascontiguousarray(amplitude,    dtype=np.float64).reshape(-1)
+        B  = np.ascontiguousarray(decay,        dtype=np.float64).reshape(-1)
+        C  = np.ascontiguousarray(rise,         dtype=np.float64).reshape(-1)
+        T0 = np.ascontiguousarray(incidentTime, dtype=np.float64).reshape(-1)
+
+        # Check the memo cache for an unchanged parameter set
+        key = self._key(A, B, C, T0)
+        with self._lock:
+            wave = self._cache.get(key)
+            if wave is not None:
+                self._cache.move_to_end(key)
+                self.cacheHits += 1
+                return wave
+            self.cacheMisses += 1
+
+        wave = self.synthesize(A, B, C, T0)
+        wave.flags.writeable = False
+
+        with self._lock:
+            self._cache[key] = wave
+            while len(self._cache) > self._cacheSize:
+                self._cache.popitem(last=False)
+
+        return wave
+
+    def synthesize(self, A, B, C, T0):
+
+        # Photons with zero amplitude do not contribute to the superposition
+        active = (A != 0)
+        A, B, C, T0 = A[active], B[active], C[active], T0[active]
+
+        if A.size == 0:
+            return np.zeros(shape=self._bufferLength, dtype=np.int16, order='C')
+
+        # The pulse shape is only defined for positive time constants
+        if np.any(B <= 0) or np.any(C <= 0):
+            raise ValueError('Decay and Rise must be positive for every event with a non-zero amplitude')
+
+        if self._templates is not None:
+            # Shift, scale and sum of the cached unit templates
+            wave = self._templates.compose(A, B, C, T0)
+            np.clip(wave, -32767.0, 32767.0, out=wave)
+            return wave.astype(np.int16)
+
+        # Delta time of every (photon x sample) grid point, zero before the incident time
+        deltaT = np.maximum(self._time[np.newaxis,:] - T0[:,np.newaxis], 0.0)
+
+        # Calculate the waveforms and superposition them
+        pulses  = np.exp(-deltaT/B[:,np.newaxis])
+        pulses *= -np.expm1(-deltaT/C[:,np.newaxis])
+        wave    = A @ pulses
+
+        # Check for overflow/underflow once then cast to the DAC sample format
+        np.clip(wave, -32767.0, 32767.0, out=wave)
+        return wave.astype(np.int16)
+
+    def synthesizeBatch(self, A, B, C, T0):
+        # (points x photons) parameter arrays to (points x samples) int16 waveforms. Each point goes through
+        # synthesize(): the template shift and add (or the per-point exp()) is cheaper than one
+        # (points x photons x samples) evaluation or a batched FFT at the few events per point of a scan
+        A  = np.atleast_2d(np.asarray(A,  dtype=np.float64))
+        B  = np.atleast_2d(np.asarray(B,  dtype=np.float64))
+        C  = np.atleast_2d(np.asarray(C,  dtype=np.float64))
+        T0 = np.atleast_2d(np.asarray(T0, dtype=np.float64))
+
+        waves = np.empty(shape=(A.shape[0], self._bufferLength), dtype=np.int16, order='C')
+        for p in range(A.shape[0]):
+            waves[p] = self.synthesize(A[p], B[p], C[p], T0[p])
+        return waves
@@ -0,0 +1,172 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import math
+import threading
+import collections
+
+import numpy as np
+
+class PulseTemplateStore(object):
+    # Unit amplitude pulse templates exp(-t/B)*(1-exp(-t/C)) = exp(-t/B)-exp(-t/D), with 1/D = 1/B+1/C,
+    # kept as their two exponential kernels so that a sub-sample delay is an exact rescale of each kernel
+    def __init__(self,
+            bufferLength = 16*2**9,  # Number of DAC samples per waveform
+            sampleRate   = 8.128E+9, # Units of Hz
+            gridStep     = 1.0E-3,   # Relative quantization step of Rise and Decay (0: no quantization)
+            maxBytes     = 32*2**20, # Memory cap of the templates, least recently used ones are evicted
+            fftEvents    = 32,       # Events sharing a template above which they are composed by FFT convolution
+        ):
+
+        self._bufferLength = bufferLength
+        self._timeBin      = (1.0/sampleRate)
+        self._maxBytes     = maxBytes
+        self._fftEvents    = fftEvents
+        self._templates    = collections.OrderedDict() # (rise, decay) grid key: (2 x samples) kernels
+        self._lock         = threading.Lock()
+        self.nbytes        = 0
+        self.hits          = 0
+        self.misses        = 0
+        self.evictions     = 0
+        self.setGridStep(gridStep)
+
+        # Linear (not circular) convolution of a buffer long impulse train with a buffer long kernel
+        m = np.arange(bufferLength+1, dtype=np.float64)
+        self._fftLength = 2*bufferLength
+        self._twiddle   = np.exp(-2j*np.pi*m/self._fftLength)
+        self._alternate = np.where(m % 2 == 0, 1.0, -1.0)
+
+    @property
+    def gridStep(self):
+        return self._gridStep
+
+    def setGridStep(self, gridStep):
+        with self._lock:
+            self._gridStep = float(gridStep)
+            self._logStep  = math.log1p(self._gridStep) if self._gridStep > 0 else 0.0
+            self._templates.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self._templates)
+
+    def _gridIndex(self, values):
+        # Vectorized quantize(): grid index and grid value of every time constant
+        if self._logStep == 0:
+            return values, values
+        idx = np.rint(np.log(values)/self._logStep)
+        return idx, np.exp(idx*self._logStep)
+
+    def quantize(self, value):
+        # Grid index and grid value of a positive time constant (log spaced grid)
+        if value <= 0:
+            raise ValueError(f'Pulse time constants must be positive (got {value})')
+        if self._logStep == 0:
+            return value, value
+        idx = round(math.log(value)/self._logStep)
+        return idx, math.exp(idx*self._logStep)
+
+    def template(self, rise, decay):
+        # Kernels exp(-j*dt/B) and exp(-j*dt/D) of the (quantized) rise/decay pair, built on the first use
+        riseKey,  rise  = self.quantize(float(rise))
+        decayKey, decay = self.quantize(float(decay))
+        key = (riseKey, decayKey)
+
+        with self._lock:
+            kernels = self._templates.get(key)
+            if kernels is not None:
+                self._templates.move_to_end(key)
+                self.hits += 1
+                return kernels, decay, rise
+            self.misses += 1
+
+        t = np.arange(self._bufferLength, dtype=np.float64)*self._timeBin
+        kernels = np.empty(shape=(2, self._bufferLength), dtype=np.float32, order='C')
+        kernels[0] = np.exp(-t/decay)
+        kernels[1] = np.exp(-t*(1.0/decay+1.0/rise))
+        kernels.flags.writeable = False
+
+        with self._lock:
+            if key not in self._templates:
+                self._templates[key] = kernels
+                self.nbytes += kernels.nbytes
+            while (self.nbytes > self._maxBytes) and (len(self._templates) > 1):
+                _, old = self._templates.popitem(last=False)
+                self.nbytes    -= old.nbytes
+                self.evictions += 1
+
+        return kernels, decay, rise
+
+    def addPulse(self, wave, amplitude, decay, rise, incidentTime):
+        # Shift, scale and add one unit template to the float64 wave buffer
+        x = incidentTime/self._timeBin
+        if (amplitude == 0) or (x >= self._bufferLength-1):
+            return
+
+        # First sample strictly after the incident time, and its delay from it (units of samples)
+        j0   = max(math.floor(x)+1, 0)
+        frac = (j0-x)*self._timeBin
+        size = self._bufferLength-j0
+
+        kernels, decay, rise = self.template(rise, decay)
+        wave[j0:] += (amplitude*math.exp(-frac/decay))*kernels[0,:size]
+        wave[j0:] -= (amplitude*math.exp(-frac*(1.0/decay+1.0/rise)))*kernels[1,:size]
+
+    def spectrum(self, tau):
+        # Analytic rfft of the zero padded kernel exp(-j*dt/tau), j < bufferLength (truncated geometric series)
+        r = math.exp(-self._timeBin/tau)
+        return (1.0-self._alternate*math.exp(-self._bufferLength*self._timeBin/tau))/(1.0-r*self._twiddle)
+
+    def compose(self, A, B, C, T0):
+        # Superposition of the photon pulses, float64 (not clipped)
+        wave = np.zeros(shape=self._bufferLength, dtype=np.float64, order='C')
+
+        # Events after the end of the buffer or with zero amplitude do not contribute
+        x      = T0/self._timeBin
+        active = (A != 0) & (x < self._bufferLength-1)
+        if not np.any(active):
+            return wave
+        A, B, C, T0, x = A[active], B[active], C[active], T0[active], x[active]
+
+        # Few events: shift, scale and add of the cached templates
+        if A.size <= self._fftEvents:
+            for i in range(A.size):
+                self.addPulse(wave, A[i], B[i], C[i], T0[i])
+            return wave
+
+        # Group the events sharing a (quantized) template
+        riseKey,  rise  = self._gridIndex(C)
+        decayKey, decay = self._gridIndex(B)
+        keys, group = np.unique(riseKey+1j*decayKey, return_inverse=True)
+        group = group.reshape(-1)
+
+        spectrum = None
+        for g in range(keys.size):
+            sel = np.flatnonzero(group == g)
+
+            # Few events: shift, scale and add of the cached template
+            if sel.size <= self._fftEvents:
+                for i in sel.tolist():
+                    self.addPulse(wave, A[i], B[i], C[i], T0[i])
+                continue
+
+            # Many events: scatter the scaled arrivals of both kernels into impulse trains and
+            # convolve them with the analytic kernel spectra (cost independent of the event count)
+            b, c = decay[sel[0]], rise[sel[0]]
+            d    = 1.0/(1.0/b+1.0/c)
+            j0   = np.maximum(np.floor(x[sel]).astype(np.int64)+1, 0)
+            frac = (j0-x[sel])*self._timeBin
+            pulse  = np.fft.rfft(np.bincount(j0, A[sel]*np.exp(-frac/b), minlength=self._bufferLength), n=self._fftLength)*self.spectrum(b)
+            pulse -= np.fft.rfft(np.bincount(j0, A[sel]*np.exp(-frac/d), minlength=self._bufferLength), n=self._fftLength)*self.spectrum(d)
+            spectrum = pulse if spectrum is None else spectrum+pulse
+
+        if spectrum is not None:
+            wave += np.fft.irfft(spectrum, n=self._fftLength)[:self._bufferLength]
+        return wave
@@ -0,0 +1,190 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import re
+import time
+import zlib
+import threading
+
+import pyrogue as pr
+
+import numpy as np
+
+class PvPublisher(pr.Device):
+    def __init__(self,
+            interval = 0.2, # Batch period (units of seconds)
+        **kwargs):
+        super().__init__(**kwargs)
+
+        self._lock    = threading.Lock()
+        self._wakeup  = threading.Event()
+        self._thread  = None
+        self._running = False
+        self._mirrors = {} # source path: mirror variable
+        self._maxRate = {} # source path: max publish rate (units of Hz, 0: every batch)
+        self._pending = {} # source path: latest value not yet published
+        self._digest  = {} # source path: last published value digest
+        self._last    = {} # source path: last publish time
+
+        # Per source path counts and rates of the received and published updates, and the unchanged ones suppressed
+        self._received   = {}
+        self._published  = {}
+        self._rates      = {} # source path: (received rate, published rate)
+        self._rateCounts = ({}, {}, time.monotonic())
+        self._suppressed = 0
+
+        self.add(pr.LocalVariable(
+            name        = 'Interval',
+            description = 'Batch period of the published PV updates',
+            mode        = 'RW',
+            units       = 'seconds',
+            value       = interval,
+            localSet    = lambda value, changed: self._wakeup.set() if changed else None,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'Received',
+            description  = 'Number of source variable updates',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: sum(self._received.values()),
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'Published',
+            description  = 'Number of PV updates sent',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: sum(self._published.values()),
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'Suppressed',
+            description  = 'Number of batched updates dropped because the value did not change',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._suppressed,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'PvRates',
+            description  = 'Received and published update rate of every PV',
+            mode         = 'RO',
+            value        = '',
+            localGet     = self.report,
+            pollInterval = 1,
+            hidden       = True,
+        ))
+
+    @staticmethod
+    def mirrorName(path):
+        # Root.PvAdc[0].WaveformData -> PvAdc_0_WaveformData
+        return re.sub(r'[^A-Za-z0-9]+', '_', path.split('.', 1)[-1]).strip('_')
+
+    def mirror(self, var, maxRate=0.0):
+        # Add a read-only copy of var, updated in batches, and return its path for the pv_map
+        name = self.mirrorName(var.path)
+        self.add(pr.LocalVariable(
+            name        = name,
+            description = var.description,
+            mode        = 'RO',
+            typeStr     = var.typeStr,
+            units       = var.units,
+            disp        = var.disp,
+            value       = var.value(),
+            hidden      = True,
+        ))
+
+        self._mirrors[var.path]   = self.node(name)
+        self._maxRate[var.path]   = maxRate
+        self._received[var.path]  = 0
+        self._published[var.path] = 0
+        var.addListener(self._update)
+        return f'{self.path}.{name}'
+
+    def _update(self, path, varValue):
+        # Listener: only keep the latest value, the batch thread does the rest
+        with self._lock:
+            self._pending[path]   = varValue.value
+            self._received[path] += 1
+
+    @staticmethod
+    def digest(value):
+        # Cheap content digest: crc32 of the array data, the value itself otherwise
+        if isinstance(value, np.ndarray):
+            return (value.dtype.str, value.shape, zlib.crc32(np.ascontiguousarray(value).view(np.uint8)))
+        return value
+
+    def _start(self):
+        super()._start()
+        self._running = True
+        self._thread  = threading.Thread(target=self._run, name=f'{self.path}.batch', daemon=True)
+        self._thread.start()
+
+    def _stop(self):
+        self._running = False
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        super()._stop()
+
+    def _run(self):
+        while self._running:
+            self._wakeup.wait(max(0.001, float(self.Interval.value())))
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        now = time.monotonic()
+
+        # Take the values whose PV rate limit allows an update, the others wait for a later batch
+        with self._lock:
+            batch = {}
+            for path, value in self._pending.items():
+                rate = self._maxRate[path]
+                if (rate <= 0) or (now-self._last.get(path, 0.0) >= 1.0/rate):
+                    batch[path] = value
+            for path in batch:
+                del self._pending[path]
+
+        for path, value in batch.items():
+            digest = self.digest(value)
+            if (path in self._digest) and (self._digest[path] == digest):
+                self._suppressed += 1
+                continue
+            self._mirrors[path].set(value)
+            self._digest[path]     = digest
+            self._last[path]       = now
+            self._published[path] += 1
+
+        self._updateRates(now)
+
+    def _updateRates(self, now):
+        received, published, t0 = self._rateCounts
+        if now-t0 < 1.0:
+            return
+        with self._lock:
+            self._rates = {p: ((self._received[p]-received.get(p, 0))/(now-t0), (self._published[p]-published.get(p, 0))/(now-t0)) for p in self._mirrors}
+            self._rateCounts = (dict(self._received), dict(self._published), now)
+
+    def rates(self):
+        # {source path: (received updates/s, published updates/s)}
+        with self._lock:
+            return dict(self._rates)
+
+    def report(self):
+        lines = [f'{"PV":<60} {"In (Hz)":>9} {"Out (Hz)":>9}']
+        for path, (rx, tx) in sorted(self.rates().items()):
+            lines.append(f'{path:<60} {rx:>9.1f} {tx:>9.1f}')
+        return '\n'.join(lines)
@@ -15,7 +15,7 @@ import surf.xilinx              as xil
 import rfsoc_4x2_photon_detector_dev as rfsoc
 
 class RFSoC(pr.Device):
-    def __init__(self,top_level='',**kwargs):
+    def __init__(self,top_level='',numCh=1,instrumentation=None,sipmLibrary='config/SipmWave8GSPS.wlib',sipmCsv='config/SipmWave8GSPS.csv',**kwargs):
         super().__init__(**kwargs)
 
         self.add(socCore.AxiSocCore(
@@ -28,7 +28,11 @@ class RFSoC(pr.Device):
         ))
 
         self.add(rfsoc.Application(
-            offset    = 0xA000_0000,
-            top_level = top_level,
-            expand    = True,
+            offset          = 0xA000_0000,
+            top_level       = top_level,
+            numCh           = numCh,
+            instrumentation = instrumentation,
+            sipmLibrary     = sipmLibrary,
+            sipmCsv         = sipmCsv,
+            expand          = True,
         ))
@@ -0,0 +1,173 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import zlib
+import threading
+
+import numpy as np
+
+# Optional faster codecs, zlib is always available
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# On-disk layout of a record data file:
+#   sequence of chunks, each a 32 byte RecordChunkHeader followed by the compressed payload
+#   payload: delta encoded little-endian int16 samples of the chunk frames (single channel)
+# Sidecar index file (<data file>.idx):
+#   sequence of RecordIndexEntry, one per frame, appended once the frame chunk is on disk
+RecordMagic       = b'SIPMRCHK'
+RecordIndexSuffix = '.idx'
+RecordCodecs      = {0: 'none', 1: 'zlib', 2: 'lz4', 3: 'zstd'}
+RecordChunkHeader = np.dtype([
+    ('magic',     'S8'),
+    ('codec',     '<u2'),
+    ('channel',   '<u2'),
+    ('frames',    '<u4'),
+    ('rawSize',   '<u8'),
+    ('compSize',  '<u8'),
+])
+RecordIndexEntry  = np.dtype([
+    ('frame',     '<u8'), # Frame number of the recording (all channels)
+    ('chFrame',   '<u8'), # Frame number of the channel
+    ('timestamp', '<f8'), # Receive time (units of seconds since the epoch)
+    ('channel',   '<u2'),
+    ('reserved',  '<u2'),
+    ('size',      '<u4'), # Frame payload size (units of bytes)
+    ('chunk',     '<u8'), # File offset of the chunk header
+    ('offset',    '<u8'), # Offset of the frame in the decompressed chunk payload (units of bytes)
+])
+
+def recordCodec(name=None):
+    # Best available codec when no name is given
+    if name is None:
+        name = 'zstd' if zstandard is not None else 'lz4' if lz4 is not None else 'zlib'
+    if (name == 'zstd' and zstandard is None) or (name == 'lz4' and lz4 is None):
+        raise ValueError(f'Codec {name} is not installed')
+    for key, value in RecordCodecs.items():
+        if value == name:
+            return key
+    raise ValueError(f'Unknown codec {name}, expected one of {list(RecordCodecs.values())}')
+
+def deltaEncode(samples):
+    # First difference of the int16 samples (wraps around, exactly inverted by deltaDecode)
+    delta = np.empty_like(samples)
+    if samples.size > 0:
+        delta[0] = samples[0]
+        np.subtract(samples[1:], samples[:-1], out=delta[1:])
+    return delta
+
+def deltaDecode(delta):
+    return np.cumsum(delta, dtype=np.int16)
+
+def compress(codec, data):
+    if codec == 1:
+        return zlib.compress(data, 1)
+    if codec == 2:
+        return lz4.frame.compress(data)
+    if codec == 3:
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return bytes(data)
+
+def decompress(codec, data):
+    if codec == 1:
+        return zlib.decompress(data)
+    if codec == 2:
+        return lz4.frame.decompress(data)
+    if codec == 3:
+        return zstandard.ZstdDecompressor().decompress(data)
+    return bytes(data)
+
+def encodeChunk(codec, channel, frames):
+    # frames: list of uint8 payloads of a single channel, padded to whole int16 samples
+    raw     = np.concatenate([np.frombuffer(f, dtype=np.uint8) for f in frames]) if frames else np.zeros(0, dtype=np.uint8)
+    payload = compress(codec, deltaEncode(raw.view('<i2')).tobytes())
+
+    header = np.zeros(1, dtype=RecordChunkHeader)
+    header['magic']    = RecordMagic
+    header['codec']    = codec
+    header['channel']  = channel
+    header['frames']   = len(frames)
+    header['rawSize']  = raw.size
+    header['compSize'] = len(payload)
+    return header.tobytes() + payload
+
+class RecordReader(object):
+    def __init__(self, path, cacheChunks=4):
+        self._path  = path
+        self._file  = open(path, 'rb')
+        self._lock  = threading.Lock()
+        self._cache = {} # chunk offset: decoded uint8 payload
+        self._cacheChunks = cacheChunks
+
+        # Chunks of different channels complete out of order: sort the index by frame number
+        self.index = np.sort(np.fromfile(path+RecordIndexSuffix, dtype=RecordIndexEntry), order='frame')
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.index.size
+
+    @property
+    def channels(self):
+        return np.unique(self.index['channel'])
+
+    def _chunk(self, offset):
+        with self._lock:
+            if offset in self._cache:
+                return self._cache[offset]
+
+            self._file.seek(offset)
+            header = np.frombuffer(self._file.read(RecordChunkHeader.itemsize), dtype=RecordChunkHeader)
+            if (header.size != 1) or (header['magic'][0] != RecordMagic):
+                raise ValueError(f'{self._path}: no chunk at offset {offset}')
+            payload = decompress(int(header['codec'][0]), self._file.read(int(header['compSize'][0])))
+            data    = deltaDecode(np.frombuffer(payload, dtype='<i2')).view(np.uint8)
+
+            if len(self._cache) >= self._cacheChunks:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[offset] = data
+            return data
+
+    def entry(self, n, channel=None):
+        # Index entry of the n-th frame of the recording, or of the channel when given
+        if channel is None:
+            return self.index[n]
+        rows = np.flatnonzero(self.index['channel'] == channel)
+        return self.index[rows[n]]
+
+    def read(self, n, channel=None):
+        # Seek straight to the chunk of the frame: only that chunk is read and decompressed
+        entry = self.entry(n, channel)
+        data  = self._chunk(int(entry['chunk']))
+        start = int(entry['offset'])
+        return data[start:start+int(entry['size'])].copy()
+
+    def samples(self, n, channel=None):
+        frame = self.read(n, channel)
+        return frame[:frame.size & ~0x1].view(np.int16)
+
+    def find(self, timestamp, channel=None):
+        # Number of the first frame received at or after timestamp
+        entries = self.index if channel is None else self.index[self.index['channel'] == channel]
+        return int(np.searchsorted(entries['timestamp'], timestamp))
@@ -0,0 +1,281 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import threading
+import collections
+
+import pyrogue as pr
+
+import numpy as np
+
+import rfsoc_4x2_photon_detector_dev as rfsoc
+
+# Readback metrics kept in the rolling history: (name, units, description)
+ResidualMetrics = [
+    ('Residual', '',        'RMS of the ADC frame minus the fitted reference, relative to the reference RMS'),
+    ('Gain',     '',        'Least squares gain of the reference in the ADC frame'),
+    ('Delay',    'seconds', 'Delay of the ADC frame with respect to the reference (cross-correlation peak)'),
+]
+
+class ResidualMonitor(pr.DataReceiver):
+    def __init__(self,
+            loader       = None,     # SigGenLoader whose loaded waveform is the reference
+            sampleRate   = 2.032E+9, # ADC sample rate (units of Hz)
+            decimation   = 4,        # DAC to ADC sample rate ratio
+            maxSize      = 4*2**9,   # Max number of int16 samples per frame
+            historyDepth = 1000,     # Number of frames kept in the rolling history
+            window       = 100,      # Number of frames averaged by the rolling means
+            refCache     = 8,        # Number of waveform versions whose reference is kept
+        **kwargs):
+        super().__init__(**kwargs)
+
+        self._loader     = loader
+        self._timeBin    = 1.0/sampleRate
+        self._decimation = decimation
+        self._depth      = historyDepth
+        self._lock       = threading.Lock()
+        self._buffer     = rfsoc.FrameBuffer(maxSize)
+
+        # Reference of the frame being compared, taken from a per-version cache of the triggered waveforms
+        self._refs        = collections.OrderedDict()
+        self._refDepth    = refCache
+        self._lastTrig    = 0    # Sequence of the last loader trigger matched to a frame
+        self._refVersion  = -1
+        self._refSize     = 0
+        self._refSpectrum = None # rfft of the zero mean reference
+        self._refNorm     = 0.0  # Sum of squares of the zero mean reference
+        self._freq        = None # rfft bin frequencies (units of cycles/sample)
+
+        # Rolling history of the metrics, and their mean over the first window after a HistoryReset. Gain and
+        # delay belong to the loopback, not to the waveform: the history is kept across reference changes
+        self._ring     = np.zeros(shape=(len(ResidualMetrics), historyDepth), dtype=np.float64, order='C')
+        self._ringIdx  = 0
+        self._ringCnt  = 0
+        self._start    = None
+        self._startAcc = []
+        self._last     = np.zeros(shape=len(ResidualMetrics), dtype=np.float64, order='C')
+        self._frames   = 0
+        self._skipped  = 0
+
+        self.add(pr.LocalVariable(
+            name        = 'Window',
+            description = 'Number of frames averaged by the rolling means and the drift baseline',
+            mode        = 'RW',
+            value       = window,
+            minimum     = 1,
+            maximum     = historyDepth,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'ReferenceVersion',
+            description  = 'SigGenLoader WaveformVersion of the cached reference',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: max(self._refVersion, 0),
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'MonitoredFrames',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._frames,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'SkippedFrames',
+            description  = 'Frames without a usable reference (nothing loaded, a flat waveform or an ambiguous trigger)',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._skipped,
+            pollInterval = 1,
+        ))
+
+        for i, (name, units, description) in enumerate(ResidualMetrics):
+
+            # Metric of the last frame
+            self.add(pr.LocalVariable(
+                name         = name,
+                description  = description,
+                mode         = 'RO',
+                units        = units,
+                value        = 0.0,
+                disp         = '{:1.3e}',
+                localGet     = lambda i=i: float(self._last[i]),
+                pollInterval = 1,
+            ))
+
+            # Rolling mean over the last Window frames
+            self.add(pr.LocalVariable(
+                name         = f'{name}Mean',
+                mode         = 'RO',
+                units        = units,
+                value        = 0.0,
+                disp         = '{:1.3e}',
+                localGet     = lambda i=i: self._mean(i),
+                pollInterval = 1,
+            ))
+
+            # Rolling history, oldest first
+            self.add(pr.LocalVariable(
+                name         = f'{name}History',
+                mode         = 'RO',
+                typeStr      = 'Float[np]',
+                units        = units,
+                value        = np.zeros(shape=0, dtype=np.float32, order='C'),
+                localGet     = lambda i=i: self._history(i),
+                pollInterval = 1,
+                hidden       = True,
+            ))
+
+        self.add(pr.LocalVariable(
+            name         = 'GainDrift',
+            description  = 'GainMean change since the first Window frames after the last HistoryReset',
+            mode         = 'RO',
+            value        = 0.0,
+            disp         = '{:1.3e}',
+            localGet     = lambda: self._drift(1),
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'DelayDrift',
+            description  = 'DelayMean change since the first Window frames after the last HistoryReset',
+            mode         = 'RO',
+            units        = 'seconds',
+            value        = 0.0,
+            disp         = '{:1.3e}',
+            localGet     = lambda: self._drift(2),
+            pollInterval = 1,
+        ))
+
+        @self.command(description='Clear the rolling history and restart the drift baseline')
+        def HistoryReset():
+            with self._lock:
+                self._resetHistory()
+
+    def _resetHistory(self):
+        # Must be called with the lock held
+        self._ringIdx  = 0
+        self._ringCnt  = 0
+        self._start    = None
+        self._startAcc = []
+
+    def _history(self, i):
+        with self._lock:
+            return np.roll(self._ring[i], -self._ringIdx)[self._depth-self._ringCnt:].astype(np.float32)
+
+    def _mean(self, i):
+        window = max(1, int(self.Window.value()))
+        hist   = self._history(i)[-window:]
+        return float(np.mean(hist)) if hist.size > 0 else 0.0
+
+    def _drift(self, i):
+        with self._lock:
+            start = self._start
+        return self._mean(i)-start[i] if start is not None else 0.0
+
+    def _setReference(self, version, dac):
+        if version == self._refVersion:
+            return
+
+        cached = self._refs.get(version)
+        if cached is not None:
+            self._refs.move_to_end(version)
+        else:
+            # Decimate the DAC buffer to the ADC rate (block average) and cache its spectrum
+            size = (dac.size//self._decimation)*self._decimation
+            ref  = dac[:size].reshape(-1, self._decimation).mean(axis=1)
+            ref -= np.mean(ref)
+
+            cached = (ref.size, np.fft.rfft(ref), float(np.dot(ref, ref)), np.fft.rfftfreq(ref.size))
+            self._refs[version] = cached
+            while len(self._refs) > self._refDepth:
+                self._refs.popitem(last=False)
+
+        self._refVersion = version
+        self._refSize, self._refSpectrum, self._refNorm, self._freq = cached
+
+    def _matchTrigger(self):
+        # (version, buffer) of the waveform that produced the frame being processed, None if ambiguous.
+        # Frames come in trigger order: a frame belongs to the oldest trigger not matched to a frame yet
+        triggers = self._loader.triggeredWaveforms()
+        if len(triggers) == 0:
+            # Nothing triggered from software (e.g. free running frames): the waveform in the DAC RAM
+            return self._loader.loadedWaveform()
+
+        pending = [t for t in triggers if t[0] > self._lastTrig]
+        if len(pending) == 0:
+            # No trigger since the last frame: the DAC still plays the last triggered waveform
+            return triggers[-1][2:]
+
+        if len(set(t[2] for t in pending)) > 1:
+            # Triggers of different waveforms since the last frame (a late or lost frame): skip this
+            # frame and resynchronize on the latest trigger
+            self._lastTrig = pending[-1][0]
+            return None
+
+        self._lastTrig = pending[0][0]
+        return pending[0][2:]
+
+    def process(self, frame):
+        wave = self._buffer.read(frame)
+
+        matched = self._matchTrigger() if self._loader is not None else None
+        if matched is None:
+            self._skipped += 1
+            return
+        self._setReference(*matched)
+
+        metrics = self.compare(wave)
+        if metrics is None:
+            self._skipped += 1
+            return
+
+        window = max(1, int(self.Window.value()))
+        with self._lock:
+            self._ring[:,self._ringIdx] = metrics
+            self._ringIdx  = (self._ringIdx+1) % self._depth
+            self._ringCnt  = min(self._ringCnt+1, self._depth)
+            self._last[:]  = metrics
+            self._frames  += 1
+
+            # Drift baseline: mean of the first window frames after the last HistoryReset
+            if self._start is None:
+                self._startAcc.append(metrics)
+                if len(self._startAcc) >= window:
+                    self._start    = np.mean(self._startAcc, axis=0)
+                    self._startAcc = []
+
+    def compare(self, wave):
+        # (residual, gain, delay) of an ADC frame against the cached reference, None without a reference
+        n = self._refSize
+        if (n < 3) or (self._refNorm <= 0) or (wave.size < n):
+            return None
+
+        adc  = wave[:n].astype(np.float64)
+        adc -= np.mean(adc)
+        spec = np.fft.rfft(adc)
+
+        # Circular cross-correlation peak, refined to a fraction of a sample with a parabola
+        xcorr = np.fft.irfft(spec*np.conj(self._refSpectrum), n=n)
+        peak  = int(np.argmax(xcorr))
+        y0, y1, y2 = xcorr[peak-1], xcorr[peak], xcorr[(peak+1) % n]
+        curve = y0-2*y1+y2
+        delay = peak + (0.5*(y0-y2)/curve if curve < 0 else 0.0)
+        if delay > n/2:
+            delay -= n
+
+        # Reference delayed by the fractional delay (phase ramp), least squares gain and relative residual RMS
+        ref  = np.fft.irfft(self._refSpectrum*np.exp(-2j*np.pi*self._freq*delay), n=n)
+        gain = float(np.dot(adc, ref))/self._refNorm
+        rms  = np.sqrt(np.mean((adc-gain*ref)**2))
+        return np.array([rms/np.sqrt(self._refNorm/n), gain, delay*self._timeBin])
@@ -30,14 +30,30 @@ rogue.Version.minVersion('6.0.0')
 
 class Root(pr.Root):
     def __init__(self,
-            ip           = '10.0.0.10', # ETH Host Name (or IP address)
-            top_level    = '',
-            defaultFile  = 'config/defaults.yml',
-            lmkConfig    = 'config/lmk/HexRegisterValues.txt',
-            lmxConfig    = 'config/lmx/HexRegisterValues.txt',
-            epics_enable = False,
-            epics_prefix = 'rfsoc_ioc',
-            zmqSrvEn     = True,  # Flag to include the ZMQ server
+            ip              = '10.0.0.10', # ETH Host Name (or IP address)
+            top_level       = '',
+            defaultFile     = 'config/defaults.yml',
+            lmkConfig       = 'config/lmk/HexRegisterValues.txt',
+            lmxConfig       = 'config/lmx/HexRegisterValues.txt',
+            sipmLibrary     = 'config/SipmWave8GSPS.wlib', # Binary library of recorded SiPM waveforms (relative to top_level)
+            sipmCsv         = 'config/SipmWave8GSPS.csv',  # Only used to create sipmLibrary if missing
+            epics_enable    = False,
+            epics_prefix    = 'rfsoc_ioc',
+            epics_interval  = 0.2,   # Batch period of the read-only PV updates (units of seconds)
+            zmqSrvEn        = True,  # Flag to include the ZMQ server
+            numCh           = 1,     # Number of ADC/DAC channels, must match the firmware NUM_*_CH_G configs
+            displayRate     = 1.0,   # Max GUI waveform update rate (units of Hz, 0: no limit)
+            displayDecim    = 1,     # GUI waveform min/max decimation factor (1: full waveforms)
+            pvRate          = 1.0,   # Max EPICS waveform PV update rate (units of Hz, 0: no limit)
+            pvDecim         = 1,     # EPICS waveform PV min/max decimation factor (1: full waveforms)
+            shmPrefix       = None,  # Publish the ring buffers to the shared memory rings <shmPrefix>_adc<i>/_dac<i> (None: disabled)
+            shmSlots        = 64,    # Number of frames kept in each shared memory ring
+            emulate         = False, # Flag to target the hardware emulator instead of the RFSoC
+            emuLocal        = True,  # True: run the emulator in this process, False: connect to scripts/hwEmulator.py at ip
+            emuFrameRate    = 0.0,   # Emulator free running frame rate (units of Hz, 0: only on StartDacFlag)
+            dspResetTimeout = 10.0,  # Max time to wait for the DSP clock to be stable at start (units of seconds)
+            startupTimeout  = 300.0, # Max time for all the start() stages (units of seconds, None: no limit)
+            softTrigger     = True,  # Enable the software trigger scheduler at the end of start()
             **kwargs):
         super().__init__(**kwargs)
 
@@ -48,9 +64,15 @@ class Root(pr.Root):
         #################################################################
 
         # Local Variables
-        self.epics_enable = epics_enable
-        self.epics_prefix = epics_prefix
-        self.top_level    = top_level
+        self.epics_enable    = epics_enable
+        self.epics_prefix    = epics_prefix
+        self.top_level       = top_level
+        self.emulate         = emulate
+        self.numCh           = numCh
+        self.dspResetTimeout = dspResetTimeout
+        self.startupTimeout  = startupTimeout
+        self.softTrigger     = softTrigger
+        self.startupTiming   = {}
         if self.top_level != '':
             self.defaultFile = f'{top_level}/{defaultFile}'
             self.lmkConfig   = f'{top_level}/{lmkConfig}'
@@ -64,12 +86,24 @@ class Root(pr.Root):
         self.dataWriter = pr.utilities.fileio.StreamWriter()
         self.add(self.dataWriter)
 
+        # Compressed, chunked and indexed file writer (same channel numbers as the dataWriter)
+        self.add(rfsoc.ChunkedRecorder(
+            name = 'Recorder',
+        ))
+
         ##################################################################################
         ##                              Register Access
         ##################################################################################
 
-        # Check if we can ping the device and TCP socket not open
-        soc_core.connectionTest(ip)
+        if self.emulate and emuLocal:
+            # Serve the register map and ring buffer streams from a local emulator
+            ip = '127.0.0.1'
+            self._emulator = rfsoc.HardwareEmulator(host=ip, numCh=numCh, frameRate=emuFrameRate)
+            self.addInterface(self._emulator)
+
+        elif not self.emulate:
+            # Check if we can ping the device and TCP socket not open
+            soc_core.connectionTest(ip)
 
         # Start a TCP Bridge Client, Connect remote server at 'ethReg' ports 9000 & 9001.
         self.memMap = rogue.interfaces.memory.TcpClient(ip,9000)
@@ -80,46 +114,108 @@ class Root(pr.Root):
             memBase    = self.memMap,
         ))
 
+        # Latency/throughput statistics of the hot path stages and sampling profiler
+        self.add(rfsoc.Instrumentation(
+            name = 'Instrumentation',
+        ))
+
         # Added the RFSoC device
         self.add(rfsoc.RFSoC(
-            memBase    = self.memMap,
-            offset     = 0x04_0000_0000, # Full 40-bit address space
-            top_level  = self.top_level,
-            expand     = True,
+            memBase         = self.memMap,
+            offset          = 0x04_0000_0000, # Full 40-bit address space
+            top_level       = self.top_level,
+            numCh           = numCh,
+            instrumentation = self.Instrumentation,
+            sipmLibrary     = sipmLibrary,
+            sipmCsv         = sipmCsv,
+            expand          = True,
         ))
 
+        if self.emulate and emuLocal:
+            self._emulator.attach(self.RFSoC)
+
+        # Incremental register reads of the devices touched since their last read
+        self.add(rfsoc.IncrementalReader(
+            name = 'IncrementalRead',
+        ))
+        for i in range(numCh):
+            self.RFSoC.Application.sigGenLoaders[i].addWriteListener(self.IncrementalRead.markDirty)
+
         ##################################################################################
         ##                              Data Path
         ##################################################################################
 
         # Create rogue stream arrays
-        self.ringBufferAdc = [stream.TcpClient(ip,10000+2*(i+0))  for i in range(1)]
-        self.ringBufferDac = [stream.TcpClient(ip,10000+2*(i+16)) for i in range(1)]
+        self.ringBufferAdc = [stream.TcpClient(ip,10000+2*(i+0))  for i in range(numCh)]
+        self.ringBufferDac = [stream.TcpClient(ip,10000+2*(i+16)) for i in range(numCh)]
+
+        # Rate limiting/decimation of the monitoring (GUI and EPICS) paths
+        self.adcDisplayFilter = [rfsoc.FrameDownsampler(name=f'AdcDisplayFilter[{i}]',maxRate=displayRate,decimation=displayDecim,maxSize=4*2**9)  for i in range(numCh)]
+        self.dacDisplayFilter = [rfsoc.FrameDownsampler(name=f'DacDisplayFilter[{i}]',maxRate=displayRate,decimation=displayDecim,maxSize=16*2**9) for i in range(numCh)]
+        self.pvAdcFilter      = [rfsoc.FrameDownsampler(name=f'PvAdcFilter[{i}]',maxRate=pvRate,decimation=pvDecim,maxSize=4*2**9)  for i in range(numCh)]
+        self.pvDacFilter      = [rfsoc.FrameDownsampler(name=f'PvDacFilter[{i}]',maxRate=pvRate,decimation=pvDecim,maxSize=16*2**9) for i in range(numCh)]
+
+        self.adcProcessor  = [rfsoc_utility.RingBufferProcessor(name=f'AdcProcessor[{i}]',sampleRate=self.adcDisplayFilter[i].outputRate(2.032E+9),maxSize=self.adcDisplayFilter[i].outputSize(4*2**9))  for i in range(numCh)]
+        self.dacProcessor  = [rfsoc_utility.RingBufferProcessor(name=f'DacProcessor[{i}]',sampleRate=self.dacDisplayFilter[i].outputRate(8.128E+9),maxSize=self.dacDisplayFilter[i].outputSize(16*2**9)) for i in range(numCh)]
 
-        self.adcRateDrop   = [stream.RateDrop(True,1.0) for i in range(1)]
-        self.dacRateDrop   = [stream.RateDrop(True,1.0) for i in range(1)]
+        self.pvAdc = [rfsoc_utility.RingBufferProcessor(name=f'PvAdc[{i}]',sampleRate=self.pvAdcFilter[i].outputRate(2.032E+9),maxSize=self.pvAdcFilter[i].outputSize(4*2**9), liveDisplay=False) for i in range(numCh)]
+        self.pvDac = [rfsoc_utility.RingBufferProcessor(name=f'PvDac[{i}]',sampleRate=self.pvDacFilter[i].outputRate(8.128E+9),maxSize=self.pvDacFilter[i].outputSize(16*2**9),liveDisplay=False) for i in range(numCh)]
 
-        self.adcProcessor  = [rfsoc_utility.RingBufferProcessor(name=f'AdcProcessor[{i}]',sampleRate=2.032E+9,maxSize=4*2**9)  for i in range(1)]
-        self.dacProcessor  = [rfsoc_utility.RingBufferProcessor(name=f'DacProcessor[{i}]',sampleRate=8.128E+9,maxSize=16*2**9) for i in range(1)]
+        self.pulseAnalyzer = [rfsoc.PulseAnalyzer(name=f'PulseAnalyzer[{i}]',sampleRate=2.032E+9,maxSize=4*2**9) for i in range(numCh)]
 
-        self.pvAdc = [rfsoc_utility.RingBufferProcessor(name=f'PvAdc[{i}]',sampleRate=2.032E+9,maxSize=4*2**9, liveDisplay=False) for i in range(1)]
-        self.pvDac = [rfsoc_utility.RingBufferProcessor(name=f'PvDac[{i}]',sampleRate=8.128E+9,maxSize=16*2**9,liveDisplay=False) for i in range(1)]
+        # Readback fidelity: ADC frames against the waveform loaded in the DAC of the same channel
+        self.residualMonitor = [rfsoc.ResidualMonitor(name=f'ResidualMonitor[{i}]',loader=self.RFSoC.Application.sigGenLoaders[i],sampleRate=2.032E+9,decimation=4,maxSize=4*2**9) for i in range(numCh)]
+
+        # Zero-copy fan-out of the raw frames to the analysis processes of this host
+        if shmPrefix is not None:
+            self.shmAdc = [rfsoc.SharedRingPublisher(name=f'ShmAdc[{i}]',shmName=f'{shmPrefix}_adc{i}',slots=shmSlots,slotSamples=4*2**9,sampleRate=2.032E+9)  for i in range(numCh)]
+            self.shmDac = [rfsoc.SharedRingPublisher(name=f'ShmDac[{i}]',shmName=f'{shmPrefix}_dac{i}',slots=shmSlots,slotSamples=16*2**9,sampleRate=8.128E+9) for i in range(numCh)]
+
+        # Timing taps: frame handling time and throughput of the processors and of the file writer
+        self.adcProcessorTap = [rfsoc.TimingTap(self.Instrumentation.stage('AdcProcessor')) for i in range(numCh)]
+        self.dacProcessorTap = [rfsoc.TimingTap(self.Instrumentation.stage('DacProcessor')) for i in range(numCh)]
+        self.adcWriterTap    = [rfsoc.TimingTap(self.Instrumentation.stage('DataWriter'))   for i in range(numCh)]
+        self.dacWriterTap    = [rfsoc.TimingTap(self.Instrumentation.stage('DataWriter'))   for i in range(numCh)]
+
+        # Scan point tags are recorded on a channel of their own, next to the ADC/DAC frames
+        scan = self.RFSoC.Application.ScanEngine
+        self.ringBufferAdc[0] >> scan.adcMonitor
+        scan >> self.dataWriter.getChannel(32)
+        scan >> self.Recorder.getChannel(32)
 
         # Connect the rogue stream arrays: ADC/DAC Ring Buffer Path
-        for i in range(1):
+        for i in range(numCh):
 
-            self.ringBufferAdc[i] >> self.dataWriter.getChannel(i+0)
-            self.ringBufferAdc[i] >> self.adcRateDrop[i] >> self.adcProcessor[i]
+            self.ringBufferAdc[i] >> self.adcWriterTap[i] >> self.dataWriter.getChannel(i+0)
+            self.ringBufferAdc[i] >> self.Recorder.getChannel(i+0)
+            self.ringBufferAdc[i] >> self.adcDisplayFilter[i] >> self.adcProcessorTap[i] >> self.adcProcessor[i]
+            self.add(self.adcDisplayFilter[i])
             self.add(self.adcProcessor[i])
 
-            self.ringBufferAdc[i] >> self.pvAdc[i]
+            self.ringBufferAdc[i] >> self.pvAdcFilter[i] >> self.pvAdc[i]
+            self.add(self.pvAdcFilter[i])
             self.add(self.pvAdc[i])
 
-            self.ringBufferDac[i] >> self.dataWriter.getChannel(i+16)
-            self.ringBufferDac[i] >> self.dacRateDrop[i] >> self.dacProcessor[i]
+            self.ringBufferAdc[i] >> self.pulseAnalyzer[i]
+            self.add(self.pulseAnalyzer[i])
+
+            self.ringBufferAdc[i] >> self.residualMonitor[i]
+            self.add(self.residualMonitor[i])
+
+            if shmPrefix is not None:
+                self.ringBufferAdc[i] >> self.shmAdc[i]
+                self.ringBufferDac[i] >> self.shmDac[i]
+                self.add(self.shmAdc[i])
+                self.add(self.shmDac[i])
+
+            self.ringBufferDac[i] >> self.dacWriterTap[i] >> self.dataWriter.getChannel(i+16)
+            self.ringBufferDac[i] >> self.Recorder.getChannel(i+16)
+            self.ringBufferDac[i] >> self.dacDisplayFilter[i] >> self.dacProcessorTap[i] >> self.dacProcessor[i]
+            self.add(self.dacDisplayFilter[i])
             self.add(self.dacProcessor[i])
 
-            self.ringBufferDac[i] >> self.pvDac[i]
+            self.ringBufferDac[i] >> self.pvDacFilter[i] >> self.pvDac[i]
+            self.add(self.pvDacFilter[i])
             self.add(self.pvDac[i])
 
         ##################################################################################
@@ -141,21 +237,38 @@ class Root(pr.Root):
                 'Root.RFSoC.Application.EnableSoftTrig'  : f'{epics_prefix}:Root:RFSoC:Application:EnableSoftTrig',
                 'Root.RFSoC.Application.StartDacFlag'    : f'{epics_prefix}:Root:RFSoC:Application:StartDacFlag',
 
-                # DAC SiPM Waveform Loader
-                'Root.RFSoC.Application.SigGenLoader.Amplitude'    : f'{epics_prefix}:Root:RFSoC:Application:SigGenLoader:Amplitude',
-                'Root.RFSoC.Application.SigGenLoader.Decay'        : f'{epics_prefix}:Root:RFSoC:Application:SigGenLoader:Decay',
-                'Root.RFSoC.Application.SigGenLoader.Rise'         : f'{epics_prefix}:Root:RFSoC:Application:SigGenLoader:Rise',
-                'Root.RFSoC.Application.SigGenLoader.IncidentTime' : f'{epics_prefix}:Root:RFSoC:Application:SigGenLoader:IncidentTime',
-
-                # Waveform Ring Buffer variables
-                'Root.PvAdc[0].Updated'      : f'{epics_prefix}:Root:PvAdc[0]:Updated',
-                'Root.PvAdc[0].Time'         : f'{epics_prefix}:Root:PvAdc[0]:Time',
-                'Root.PvAdc[0].WaveformData' : f'{epics_prefix}:Root:PvAdc[0]:WaveformData',
-                'Root.PvDac[0].Updated'      : f'{epics_prefix}:Root:PvDac[0]:Updated',
-                'Root.PvDac[0].Time'         : f'{epics_prefix}:Root:PvDac[0]:Time',
-                'Root.PvDac[0].WaveformData' : f'{epics_prefix}:Root:PvDac[0]:WaveformData',
             }
 
+            for i in range(numCh):
+                loader = self.RFSoC.Application.sigGenLoaders[i].name
+                for name in ['Amplitude', 'Decay', 'Rise', 'IncidentTime', 'LoadTime']:
+                    # DAC SiPM Waveform Loader
+                    self.pv_map[f'Root.RFSoC.Application.{loader}.{name}'] = f'{epics_prefix}:Root:RFSoC:Application:{loader}:{name}'
+
+                for name in ['Updated', 'Time', 'WaveformData']:
+                    # Waveform Ring Buffer variables
+                    self.pv_map[f'Root.PvAdc[{i}].{name}'] = f'{epics_prefix}:Root:PvAdc[{i}]:{name}'
+                    self.pv_map[f'Root.PvDac[{i}].{name}'] = f'{epics_prefix}:Root:PvDac[{i}]:{name}'
+
+                for name in ['ResidualMean', 'GainMean', 'DelayMean', 'GainDrift', 'DelayDrift']:
+                    # Loopback readback fidelity
+                    self.pv_map[f'Root.ResidualMonitor[{i}].{name}'] = f'{epics_prefix}:Root:ResidualMonitor[{i}]:{name}'
+
+            for stage in self.Instrumentation.devices:
+                for name in ['Mean', 'P99', 'Rate']:
+                    # Hot path stage statistics
+                    self.pv_map[f'Root.Instrumentation.{stage}.{name}'] = f'{epics_prefix}:Root:Instrumentation:{stage}:{name}'
+
+            # Read-only PVs are served from batched, change detected mirrors of their variables
+            self.add(rfsoc.PvPublisher(
+                name     = 'PvPublisher',
+                interval = epics_interval,
+            ))
+            for path in list(self.pv_map):
+                var = self.getNode(path)
+                if var.mode == 'RO':
+                    self.pv_map[self.PvPublisher.mirror(var)] = self.pv_map.pop(path)
+
             self.epics = pyrogue.protocols.epicsV4.EpicsPvServer(
                 base      = self.epics_prefix,
                 root      = self,
@@ -170,28 +283,69 @@ class Root(pr.Root):
     def start(self,**kwargs):
         super(Root, self).start(**kwargs)
 
-        # Update all SW remote registers
-        self.ReadAll()
-
-        # Load the Default YAML file
-        print(f'Loading path={self.defaultFile} Default Configuration File...')
-        self.LoadConfig(self.defaultFile)
-        self.ReadAll()
+        app = self.RFSoC.Application
+        inc = self.IncrementalRead
+        seq = rfsoc.StartupSequencer()
+
+        def loadDefaults():
+            # Load the Default YAML file and read back only the devices it touched
+            print(f'Loading path={self.defaultFile} Default Configuration File...')
+            inc.loadConfig(self.defaultFile)
+            inc.readDirty()
+
+        def initClock():
+            self.Hardware.InitClock(lmkConfig=self.lmkConfig,lmxConfig=[self.lmxConfig])
+            inc.markDirty(self.Hardware, recurse=True)
+
+        def rfdcInit():
+            self.RFSoC.RfDataConverter.Init()
+            inc.markDirty(self.RFSoC.RfDataConverter, recurse=True)
+
+        def prepareWaveform():
+            # Compute the configured waveforms (memoized) while the clocks lock
+            for i in range(self.numCh):
+                if not app.sigGenLoaders[i].RunMode.value():
+                    app.sigGenLoaders[i].calcWaveform()
+
+        def waitDspReset():
+            # Wait for DSP Clock to be stable
+            timeout = time.monotonic() + self.dspResetTimeout
+            while(self.RFSoC.AxiSocCore.AxiVersion.DspReset.get()):
+                if time.monotonic() > timeout:
+                    raise TimeoutError(f'DspReset still asserted after {self.dspResetTimeout} seconds')
+                time.sleep(0.01)
+
+        # Update all SW remote registers (sweeps the Hardware subtree too)
+        seq.add('ReadAll',         inc.readAll)
+        seq.add('LoadDefaults',    loadDefaults,    deps=['ReadAll'])
+        seq.add('PrepareWaveform', prepareWaveform, deps=['LoadDefaults'])
+
+        # The emulator has no clock chips or RF data converter to initialize
+        if not self.emulate:
+
+            # Initialize the LMK/LMX Clock chips once the initial read is done, overlapping
+            # the RFSoC configuration load and the waveform precompute (which do not touch Hardware)
+            seq.add('InitClock', initClock, deps=['ReadAll'])
+
+            # Initialize the RF Data Converter
+            seq.add('RfdcInit', rfdcInit, deps=['InitClock', 'LoadDefaults'])
+            seq.add('WaitDspReset', waitDspReset, deps=['RfdcInit'])
 
-        # Initialize the LMK/LMX Clock chips
-        self.Hardware.InitClock(lmkConfig=self.lmkConfig,lmxConfig=[self.lmxConfig])
+        else:
+            seq.add('WaitDspReset', waitDspReset, deps=['LoadDefaults'])
 
-        # Initialize the RF Data Converter
-        self.RFSoC.RfDataConverter.Init()
+        # Load the waveform
+        seq.add('LoadWaveform', app.loadWaveforms, deps=['WaitDspReset', 'PrepareWaveform'])
 
-        # Wait for DSP Clock to be stable
-        while(self.RFSoC.AxiSocCore.AxiVersion.DspReset.get()):
-            time.sleep(0.01)
+        # Update the SW remote registers touched during the startup
+        seq.add('ReadDirty', inc.readDirty, deps=['LoadWaveform'])
 
-        # Load the waveform
-        self.RFSoC.Application.SigGenLoader.LoadWaveform()
+        seq.run(timeout=self.startupTimeout)
+        self.startupTiming = seq.timing
+        print(f'Startup timing:\n{seq.report()}')
 
-        # Update all SW remote registers
-        self.ReadAll()
+        # Only trigger the DAC once the clocks, the configuration and the waveforms are in place
+        if self.softTrigger:
+            app.TriggerScheduler.Enable.set(True)
 
     ##################################################################################
@@ -0,0 +1,286 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import re
+import csv
+import json
+import time
+import itertools
+import threading
+
+import rogue.interfaces.stream
+
+import pyrogue as pr
+
+import numpy as np
+
+# Waveform parameters a scan point can set (any other is taken from the loader)
+ScanParameters = ['Amplitude', 'Decay', 'Rise', 'IncidentTime']
+
+class _ScanFrameMonitor(rogue.interfaces.stream.Slave):
+    def __init__(self):
+        rogue.interfaces.stream.Slave.__init__(self)
+        self.cond  = threading.Condition()
+        self.count = 0
+
+    def _acceptFrame(self, frame):
+        with self.cond:
+            self.count += 1
+            self.cond.notify_all()
+
+    def wait(self, count, timeout):
+        # Wait for the frame counter to go past count
+        with self.cond:
+            return self.cond.wait_for(lambda: self.count > count, timeout=timeout)
+
+class ScanEngine(pr.Device, rogue.interfaces.stream.Master):
+    def __init__(self,
+            loaders   = None, # SigGenLoader devices driven by the scan (same waveform on all of them)
+            trigger   = None, # Callable that triggers the DAC signal generators
+            reset     = None, # Callable resetting the (shared) DAC FSM once all the loaders are written
+            lock      = None, # Lock serializing the waveform load + trigger with the other trigger sources
+            scheduler = None, # Optional TriggerScheduler paused during the scan
+        **kwargs):
+        pr.Device.__init__(self, **kwargs)
+        rogue.interfaces.stream.Master.__init__(self)
+
+        self._loaders   = loaders
+        self._trigger   = trigger
+        self._reset     = reset
+        self._lock      = lock if lock is not None else threading.Lock()
+        self._scheduler = scheduler
+        self._points    = []
+        self._waves     = None
+        self._thread    = None
+        self._abort     = threading.Event()
+
+        # ADC frames of the first channel (connected by Root), used to wait for every trigger readback
+        self.adcMonitor = _ScanFrameMonitor()
+
+        # Progress of the running scan
+        self._point  = -1
+        self._done   = 0
+        self._missed = 0
+        self._rate   = 0.0
+
+        self.add(pr.LocalVariable(
+            name        = 'ScanFile',
+            description = 'YAML or CSV file with the scan points',
+            mode        = 'RW',
+            value       = '',
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'Repeat',
+            description = 'Number of triggers per scan point',
+            mode        = 'RW',
+            value       = 1,
+            minimum     = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'FrameTimeout',
+            description = 'Time to wait for the ADC frame of a trigger (0 to not wait)',
+            mode        = 'RW',
+            units       = 'seconds',
+            value       = 1.0,
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'ScanPoints',
+            description = 'Number of loaded scan points',
+            mode        = 'RO',
+            value       = 0,
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'PrecomputeTime',
+            description = 'Time to synthesize all the waveforms of the scan',
+            mode        = 'RO',
+            units       = 'seconds',
+            value       = 0.0,
+            disp        = '{:1.3e}',
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'Running',
+            mode         = 'RO',
+            value        = False,
+            localGet     = lambda: (self._thread is not None) and self._thread.is_alive(),
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'ScanPoint',
+            description  = 'Scan point being triggered (-1 when idle)',
+            mode         = 'RO',
+            value        = -1,
+            localGet     = lambda: self._point,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'CompletedPoints',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._done,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'MissedFrames',
+            description  = 'Triggers without an ADC frame within FrameTimeout',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._missed,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'PointRate',
+            mode         = 'RO',
+            units        = 'Hz',
+            value        = 0.0,
+            disp         = '{:1.1f}',
+            localGet     = lambda: self._rate,
+            pollInterval = 1,
+        ))
+
+        @self.command(description='Load the scan points of ScanFile and precompute their waveforms')
+        def LoadScan():
+            self.loadScan(self.ScanFile.value())
+
+        @self.command(description='Step through the loaded scan points in the background')
+        def StartScan():
+            self.startScan()
+
+        @self.command(description='Abort the running scan after the current trigger')
+        def StopScan():
+            self.stopScan()
+
+    def _defaults(self):
+        loader = self._loaders[0]
+        return {name: np.array(loader.node(name).value(), dtype=np.float64) for name in ScanParameters}
+
+    def _makePoint(self, entries, defaults):
+        # entries: {'Name': scalar or list, 'Name[k]': scalar}, a scalar without index sets event 0
+        point = {name: value.copy() for name, value in defaults.items()}
+        for key, value in entries.items():
+            match = re.fullmatch(r'\s*(\w+)\s*(?:\[(\d+)\])?\s*', str(key))
+            if (match is None) or (match.group(1) not in ScanParameters):
+                raise ValueError(f'Unknown scan parameter {key}, expected one of {ScanParameters}')
+            name, idx = match.group(1), match.group(2)
+            value = np.asarray(value, dtype=np.float64)
+            if (idx is None) and (value.ndim > 0):
+                point[name][:value.size] = value
+            else:
+                point[name][int(idx or 0)] = value
+        return point
+
+    def parse(self, path):
+        defaults = self._defaults()
+
+        if path.endswith('.csv'):
+            # One scan point per row, columns named like the parameters (optionally Name[k])
+            with open(path, newline='') as f:
+                return [self._makePoint({k: float(v) for k, v in row.items() if v.strip() != ''}, defaults) for row in csv.DictReader(f)]
+
+        # YAML: 'Grid' (cartesian product of the listed values) and/or 'Points' (explicit list)
+        data = pr.yamlToData(fName=path)
+        data = data.get(self.name, data)
+        points = []
+        grid = data.get('Grid', {})
+        if grid:
+            names = list(grid)
+            for values in itertools.product(*[grid[n] for n in names]):
+                points.append(self._makePoint(dict(zip(names, values)), defaults))
+        for entries in data.get('Points', []):
+            points.append(self._makePoint(entries, defaults))
+        return points
+
+    def loadScan(self, path):
+        points = self.parse(path)
+        if len(points) == 0:
+            raise ValueError(f'{path} does not have any scan point')
+
+        # Synthesize every waveform of the scan up front, before the first trigger
+        start = time.perf_counter()
+        waves = self._loaders[0].calcWaveforms(*[np.vstack([p[n] for p in points]) for n in ScanParameters])
+        self.PrecomputeTime.set(time.perf_counter()-start)
+
+        self._points = points
+        self._waves  = waves
+        self.ScanPoints.set(len(points))
+
+    def startScan(self):
+        if self._waves is None:
+            raise RuntimeError('No scan loaded')
+        if (self._thread is not None) and self._thread.is_alive():
+            raise RuntimeError('Scan already running')
+        self._abort.clear()
+        self._thread = threading.Thread(target=self._run, name=f'{self.path}.scan', daemon=True)
+        self._thread.start()
+
+    def stopScan(self):
+        self._abort.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _stop(self):
+        self.stopScan()
+        super()._stop()
+
+    def _sendTag(self, point, trigger):
+        # Scan point record written to the data files right before the trigger
+        tag = {'point': point, 'trigger': trigger, 'time': time.time()}
+        tag.update({n: self._points[point][n].tolist() for n in ScanParameters})
+        data  = np.frombuffer(json.dumps(tag).encode(), dtype=np.uint8)
+        frame = self._reqFrame(data.size, True)
+        frame.write(data, 0)
+        self._sendFrame(frame)
+
+    def _run(self):
+        enabled = None
+        if self._scheduler is not None:
+            enabled = self._scheduler.Enable.value()
+            self._scheduler.Enable.set(False)
+
+        self._done   = 0
+        self._missed = 0
+        repeat  = max(1, int(self.Repeat.value()))
+        timeout = float(self.FrameTimeout.value())
+        start   = time.perf_counter()
+
+        try:
+            for point in range(len(self._points)):
+                if self._abort.is_set():
+                    break
+                self._point = point
+
+                with self._lock:
+                    for loader in self._loaders:
+                        loader.writeWaveform(self._waves[point], reset=(self._reset is None))
+                    if self._reset is not None:
+                        self._reset()
+
+                    for trigger in range(repeat):
+                        count = self.adcMonitor.count
+                        self._sendTag(point, trigger)
+                        self._trigger()
+                        if (timeout > 0) and not self.adcMonitor.wait(count, timeout):
+                            self._missed += 1
+
+                self._done += 1
+                self._rate  = self._done/(time.perf_counter()-start)
+        finally:
+            self._point = -1
+            if enabled is not None:
+                self._scheduler.Enable.set(enabled)
@@ -0,0 +1,188 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import time
+
+from multiprocessing import shared_memory
+from multiprocessing import resource_tracker
+
+import numpy as np
+
+# Layout of a shared memory ring:
+#   64 byte SharedRingHeader
+#   slots x SharedRingSlot (per slot sequence lock and frame metadata)
+#   slots x slotSamples int16 samples
+# Frame n goes to slot n % slots. The slot 'seq' is 2n+1 while frame n is written and
+# 2n+2 once it is complete: readers check it before and after using the samples.
+SharedRingMagic   = b'SIPMSHMR'
+SharedRingVersion = 1
+SharedRingHeader  = np.dtype([
+    ('magic',       'S8'),
+    ('version',     '<u4'),
+    ('headerSize',  '<u4'),
+    ('slots',       '<u4'),
+    ('slotSamples', '<u4'),
+    ('sampleRate',  '<f8'),
+    ('frames',      '<u8'), # Number of complete frames written
+    ('reserved',    'V24'),
+])
+SharedRingSlot    = np.dtype([
+    ('seq',         '<u8'),
+    ('timestamp',   '<f8'), # Receive time (units of seconds since the epoch)
+    ('size',        '<u4'), # Number of valid samples
+    ('reserved',    '<u4'),
+])
+
+def _layout(slots, slotSamples):
+    metaOffset = SharedRingHeader.itemsize
+    dataOffset = metaOffset + slots*SharedRingSlot.itemsize
+    return metaOffset, dataOffset, dataOffset + 2*slots*slotSamples
+
+class SharedRing(object):
+    def __init__(self, shm):
+        self._shm   = shm
+        self.header = np.ndarray(shape=1, dtype=SharedRingHeader, buffer=shm.buf)[0]
+        if self.header['magic'] != SharedRingMagic:
+            raise ValueError(f'{shm.name} is not a ring buffer shared memory')
+
+        self.slots       = int(self.header['slots'])
+        self.slotSamples = int(self.header['slotSamples'])
+        self.sampleRate  = float(self.header['sampleRate'])
+
+        metaOffset, dataOffset, _ = _layout(self.slots, self.slotSamples)
+        self.meta = np.ndarray(shape=self.slots, dtype=SharedRingSlot, buffer=shm.buf, offset=metaOffset)
+        self.data = np.ndarray(shape=(self.slots, self.slotSamples), dtype='<i2', buffer=shm.buf, offset=dataOffset)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def frames(self):
+        return int(self.header['frames'])
+
+    def close(self):
+        # The numpy views must go before the mapping can be closed
+        self.header = self.meta = self.data = None
+        self._shm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class SharedRingWriter(SharedRing):
+    def __init__(self, name, slots=64, slotSamples=16*2**9, sampleRate=0.0):
+        _, _, size = _layout(slots, slotSamples)
+
+        # Replace a segment left behind by a previous process
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        header = np.ndarray(shape=1, dtype=SharedRingHeader, buffer=shm.buf)
+        header[0] = np.zeros(1, dtype=SharedRingHeader)[0]
+        header['version']     = SharedRingVersion
+        header['headerSize']  = SharedRingHeader.itemsize
+        header['slots']       = slots
+        header['slotSamples'] = slotSamples
+        header['sampleRate']  = sampleRate
+        header['magic']       = SharedRingMagic
+        del header
+
+        super().__init__(shm)
+        self.meta['seq'] = 0
+
+    def beginFrame(self):
+        # Open the next slot for writing and return (frame number, writable int16 slot view)
+        n    = self.frames
+        slot = n % self.slots
+        self.meta[slot]['seq'] = 2*n+1
+        return n, self.data[slot]
+
+    def endFrame(self, n, size, timestamp):
+        slot = n % self.slots
+        self.meta[slot]['timestamp'] = timestamp
+        self.meta[slot]['size']      = size
+        self.meta[slot]['seq']       = 2*n+2
+        self.header['frames']        = n+1
+
+    def publish(self, samples, timestamp=None):
+        samples = np.asarray(samples, dtype=np.int16).reshape(-1)[:self.slotSamples]
+        n, slot = self.beginFrame()
+        slot[:samples.size] = samples
+        self.endFrame(n, samples.size, time.time() if timestamp is None else timestamp)
+        return n
+
+    def unlink(self):
+        self._shm.unlink()
+
+class SharedRingReader(SharedRing):
+    def __init__(self, name):
+        # Attach without the resource tracker, which would unlink the writer segment at exit
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        super().__init__(shm)
+        self.data.setflags(write=False)
+
+    def oldest(self):
+        # Oldest frame number still (probably) in the ring
+        return max(0, self.frames-self.slots+1)
+
+    def view(self, n):
+        # Zero-copy view of frame n and its timestamp, None if not available. The view is only
+        # valid while check(n) returns True: the writer reuses the slot slots frames later
+        slot = n % self.slots
+        if self.meta[slot]['seq'] != 2*n+2:
+            return None
+        meta = self.meta[slot]
+        view = self.data[slot,:int(meta['size'])]
+        ts   = float(meta['timestamp'])
+        return (view, ts) if self.check(n) else None
+
+    def check(self, n):
+        return self.meta[n % self.slots]['seq'] == 2*n+2
+
+    def read(self, n):
+        # Consistent copy of frame n and its timestamp, None if it was overwritten
+        got = self.view(n)
+        if got is None:
+            return None
+        view, ts = got
+        data = view.copy()
+        return (data, ts) if self.check(n) else None
+
+    def wait(self, n, timeout=None, poll=0.0005):
+        # Wait for frame n to be complete, False on timeout
+        stop = None if timeout is None else time.monotonic()+timeout
+        while self.frames <= n:
+            if (stop is not None) and (time.monotonic() > stop):
+                return False
+            time.sleep(poll)
+        return True
+
+    def follow(self, start=None, timeout=None, copy=True):
+        # Iterate over (frame number, samples, timestamp) from start (default: next frame),
+        # skipping the frames overwritten before they could be read
+        n = self.frames if start is None else start
+        while self.wait(n, timeout):
+            n = max(n, self.oldest())
+            got = self.read(n) if copy else self.view(n)
+            if got is not None:
+                yield (n,)+got
+            n += 1
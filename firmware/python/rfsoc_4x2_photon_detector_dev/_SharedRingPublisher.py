@@ -0,0 +1,108 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import time
+import threading
+
+import rogue.interfaces.stream
+
+import pyrogue as pr
+
+import numpy as np
+
+import rfsoc_4x2_photon_detector_dev as rfsoc
+
+class SharedRingPublisher(pr.Device, rogue.interfaces.stream.Slave):
+    def __init__(self,
+            shmName     = 'rfsoc_adc0', # Shared memory segment name (/dev/shm/<shmName>)
+            slots       = 64,           # Number of frames kept in the ring
+            slotSamples = 4*2**9,       # Max number of samples per frame, larger frames are truncated
+            sampleRate  = 2.032E+9,     # Sample rate of the frames (units of Hz), stored in the header for the readers
+        **kwargs):
+        pr.Device.__init__(self, **kwargs)
+        rogue.interfaces.stream.Slave.__init__(self)
+
+        self._shmName     = shmName
+        self._slots       = slots
+        self._slotSamples = slotSamples
+        self._sampleRate  = sampleRate
+        self._lock        = threading.Lock()
+        self._ring        = None
+
+        # Frames written to the shared ring, and those cut to the slot size
+        self._published = 0
+        self._truncated = 0
+
+        self.add(pr.LocalVariable(
+            name        = 'ShmName',
+            description = 'Shared memory segment readers attach to (SharedRingReader)',
+            mode        = 'RO',
+            value       = shmName,
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'Slots',
+            mode        = 'RO',
+            value       = slots,
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'SlotSamples',
+            mode        = 'RO',
+            value       = slotSamples,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'FramesPublished',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._published,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'TruncatedFrames',
+            description  = 'Frames larger than SlotSamples',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._truncated,
+            pollInterval = 1,
+        ))
+
+    def _start(self):
+        super()._start()
+        with self._lock:
+            self._ring = rfsoc.SharedRingWriter(self._shmName, slots=self._slots, slotSamples=self._slotSamples, sampleRate=self._sampleRate)
+
+    def _stop(self):
+        with self._lock:
+            if self._ring is not None:
+                self._ring.close()
+                self._ring.unlink()
+                self._ring = None
+        super()._stop()
+
+    def _acceptFrame(self, frame):
+        stamp = time.time()
+        with self._lock:
+            if self._ring is None:
+                return
+
+            # The frame payload is copied straight into the shared memory slot
+            n, slot = self._ring.beginFrame()
+            with frame.lock():
+                payload = frame.getPayload()
+                size    = min(payload, 2*self._slotSamples) & ~0x1
+                frame.read(slot.view(np.uint8)[:size], 0)
+            self._ring.endFrame(n, size//2, stamp)
+
+            self._published += 1
+            if payload > size+1:
+                self._truncated += 1
@@ -8,31 +8,83 @@
 # contained in the LICENSE.txt file.
 #-----------------------------------------------------------------------------
 
+import os
+import time
+import threading
+import collections
+
 import pyrogue as pr
+import rfsoc_4x2_photon_detector_dev as rfsoc
 
 import numpy as np
 import click
-import csv
 
 class SigGenLoader(pr.Device):
     def __init__(self,
-            DacSigGen    = None,
-            top_level    = '',
-            maxEvents    = 4,  # Max number of signal event that can be loaded
-            ramWidth     = 9, # Must match RAM_ADDR_WIDTH_G config
-            smplPerCycle = 16, # Must match SAMPLE_PER_CYCLE_G config
-            sampleRate   = 8.128E+9, # Units of Hz
+            DacSigGen       = None,
+            ch              = 0,  # DAC signal generator channel
+            top_level       = '',
+            maxEvents       = 4,  # Max number of signal event that can be loaded
+            ramWidth        = 9, # Must match RAM_ADDR_WIDTH_G config
+            smplPerCycle    = 16, # Must match SAMPLE_PER_CYCLE_G config
+            sampleRate      = 8.128E+9, # Units of Hz
+            sipmLibrary     = 'config/SipmWave8GSPS.wlib', # Binary library of recorded SiPM waveforms
+            sipmCsv         = 'config/SipmWave8GSPS.csv',  # Only used to create sipmLibrary if missing
+            queueDepth      = 8, # Number of waveforms prepared ahead of the trigger
+            instrumentation = None, # Optional Instrumentation device for the stage timing
+            worker          = None, # Optional CommandWorker running the asynchronous commands
+            lock            = None, # Lock serializing the waveform load with the other trigger sources
+            templateGrid    = 1.0E-3, # Relative Rise/Decay quantization step of the pulse templates (0: exact values)
+            templateMemory  = 32*2**20, # Memory cap of the pulse templates (units of bytes)
+            seed            = None, # Seed of the Poisson event generator (None: non-deterministic)
         **kwargs):
         super().__init__(**kwargs)
 
         self._maxEvents    = maxEvents
         self._DacSigGen    = DacSigGen
+        self._ch           = ch
         self._ramDepth     = 2**ramWidth
         self._bufferLength = smplPerCycle*2**ramWidth
         self._smplRate     = sampleRate
         self._timeBin      = (1.0/sampleRate)
+        self._listeners    = []
+        self._loadedLock   = threading.Lock()
+        self._loadedWave   = np.zeros(shape=self._bufferLength, dtype=np.int16, order='C')
+        self._loadedVer    = 0
+        self._triggers     = collections.deque(maxlen=8) # (sequence, time, version, buffer) of the last DAC triggers
+        self._trigSeq      = 0
+        self._loadLock     = lock if lock is not None else threading.Lock()
+
+        # Stage timing (shared by the loaders of all the channels)
+        self._prepareStats = rfsoc.Instrumentation.getStage(instrumentation, 'WaveformPrepare')
+        self._writeStats   = rfsoc.Instrumentation.getStage(instrumentation, 'RamWrite')
+        self._resetStats   = rfsoc.Instrumentation.getStage(instrumentation, 'FsmReset')
+        self._loadStats    = rfsoc.Instrumentation.getStage(instrumentation, 'LoadWaveform')
         dependencies       = []
 
+        # Unit pulse templates: a calculated waveform is a shift, scale and sum of cached templates
+        self._templates = rfsoc.PulseTemplateStore(
+            bufferLength = self._bufferLength,
+            sampleRate   = sampleRate,
+            gridStep     = templateGrid,
+            maxBytes     = templateMemory,
+        )
+
+        # Vectorized SiPM pulse synthesis engine with memo cache
+        self._synth = rfsoc.PulseSynthesizer(
+            bufferLength = self._bufferLength,
+            sampleRate   = sampleRate,
+            templates    = self._templates,
+        )
+
+        # Random photon arrivals of the Poisson event mode
+        self._generator  = rfsoc.PhotonGenerator(
+            bufferLength = self._bufferLength,
+            sampleRate   = sampleRate,
+            seed         = seed,
+        )
+        self._eventCount = 0
+
         self.add(pr.LocalVariable(
             name    = 'Amplitude',
             typeStr = 'Int16[np]',
@@ -63,87 +115,318 @@ class SigGenLoader(pr.Device):
 
         self.add(pr.LocalVariable(
             name        = 'RunMode',
-            description = 'True: cycle through previously recorded SiPM waveforms, False: calculated SiPM waveform',
+            description = 'True: cycle through previously recorded SiPM waveforms (a WaveformQueue flush skips the prepared records), False: calculated SiPM waveform',
             mode        = 'RW',
             value       = False,
         ))
 
-        # Create empty arrays to fill
-        self.sipmWave = [np.zeros(shape=self._bufferLength, dtype=np.int16, order='C') for i in range(100)]
+        self.add(pr.LocalVariable(
+            name        = 'EventMode',
+            description = 'Calculated waveform events, Fixed: the maxEvents Amplitude/Decay/Rise/IncidentTime, List: the Event* arrays, Poisson: random photons drawn for every waveform',
+            mode        = 'RW',
+            value       = 0,
+            enum        = {0: 'Fixed', 1: 'List', 2: 'Poisson'},
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'EventAmplitude',
+            description = 'List mode event amplitudes (any number of events)',
+            typeStr     = 'Float[np]',
+            units       = 'Counts',
+            value       = np.full(shape=1, fill_value=5000.0, dtype=np.float32, order='C'),
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'EventDecay',
+            typeStr     = 'Float[np]',
+            units       = 'seconds',
+            value       = np.full(shape=1, fill_value=100.0E-9, dtype=np.float32, order='C'),
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'EventRise',
+            typeStr     = 'Float[np]',
+            units       = 'seconds',
+            value       = np.full(shape=1, fill_value=10.0E-9, dtype=np.float32, order='C'),
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'EventIncidentTime',
+            typeStr     = 'Float[np]',
+            units       = 'seconds',
+            value       = np.full(shape=1, fill_value=100.0E-9, dtype=np.float32, order='C'),
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'PhotonRate',
+            description = 'Poisson mode photon rate',
+            mode        = 'RW',
+            units       = 'Hz',
+            value       = 100.0E+6,
+            minimum     = 0.0,
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'PhotonAmplitude',
+            description = 'Poisson mode mean photon amplitude',
+            mode        = 'RW',
+            units       = 'Counts',
+            value       = 300.0,
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'PhotonAmplitudeSigma',
+            description = 'Poisson mode standard deviation of the photon amplitude',
+            mode        = 'RW',
+            units       = 'Counts',
+            value       = 30.0,
+            minimum     = 0.0,
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'PhotonDecay',
+            mode        = 'RW',
+            units       = 'seconds',
+            value       = 100.0E-9,
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'PhotonRise',
+            mode        = 'RW',
+            units       = 'seconds',
+            value       = 10.0E-9,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'EventCount',
+            description  = 'Number of events in the last calculated waveform',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._eventCount,
+            pollInterval = 1,
+        ))
 
-        # Load the SiPM waveform data that was recorded by TargetX at 1GSPS but interpolated to 8GSPS
-        self.sipmIdx = 0
-        with open( f'{top_level}/config/SipmWave8GSPS.csv' if top_level!='' else 'config/SipmWave8GSPS.csv') as csvfile:
-            reader = csv.reader(csvfile, delimiter=',', quoting=csv.QUOTE_NONE)
-            for row in reader:
-                for smpl in range(1024):
-                    self.sipmWave[self.sipmIdx][smpl] = int(row[smpl])
-                self.sipmIdx += 1
-        self.sipmIdx = 0
+        self.add(pr.LocalVariable(
+            name         = 'WaveformVersion',
+            description  = 'Incremented when a different waveform is written to the DAC RAM',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._loadedVer,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'LoadTime',
+            description = 'Time to push the last waveform into the DAC RAM (including the FSM reset)',
+            mode        = 'RO',
+            units       = 'seconds',
+            value       = 0.0,
+            disp        = '{:1.3e}',
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'TemplateGrid',
+            description = 'Relative quantization step of Rise and Decay for the pulse templates (0: exact values)',
+            mode        = 'RW',
+            value       = templateGrid,
+            localSet    = lambda value, changed: self._setTemplateGrid(value) if changed else None,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'TemplateCount',
+            description  = 'Number of cached pulse templates',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: len(self._templates),
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'TemplateMemory',
+            mode         = 'RO',
+            units        = 'Bytes',
+            value        = 0,
+            localGet     = lambda: self._templates.nbytes,
+            pollInterval = 1,
+        ))
+
+        # Map the SiPM waveform library that was recorded by TargetX at 1GSPS but interpolated to 8GSPS
+        self.sipmIdx  = 0
+        self._idxLock = threading.Lock()
+        self.sipmLib  = self._openLibrary(
+            libPath = os.path.join(top_level, sipmLibrary),
+            csvPath = os.path.join(top_level, sipmCsv),
+        )
+
+        # Background producer of the next waveforms to load
+        self.add(rfsoc.WaveformQueue(
+            name     = 'WaveformQueue',
+            source   = self.prepareWaveform,
+            capacity = queueDepth,
+        ))
+
+        # Prepared waveforms are stale once the waveform selection changes
+        for var in [self.Amplitude, self.Decay, self.Rise, self.IncidentTime, self.RunMode, self.TemplateGrid, self.EventMode,
+                    self.EventAmplitude, self.EventDecay, self.EventRise, self.EventIncidentTime,
+                    self.PhotonRate, self.PhotonAmplitude, self.PhotonAmplitudeSigma, self.PhotonDecay, self.PhotonRise]:
+            var.addListener(lambda path, value: self.WaveformQueue.flush())
 
         @self.command(hidden=True)
         def LoadWaveform():
+            with self._loadLock:
+                self.loadWaveform()
+
+        if worker is not None:
+            @self.command(description='Queue a LoadWaveform on the command worker and return its job id')
+            def LoadWaveformAsync():
+                return worker.submit(f'{self.path}.LoadWaveform', self.LoadWaveform)
+
+    def loadWaveform(self, reset=True):
+        start = time.perf_counter()
+
+        # Dequeue the next prepared waveform and push it to hardware
+        self.writeWaveform(self.WaveformQueue.pop(), reset=reset)
+        self.WaveformQueue.recordWrite(self.LoadTime.value())
+        self._loadStats.record(time.perf_counter()-start)
 
-            if self.RunMode.value():
+    def _openLibrary(self, libPath, csvPath):
+        if os.path.exists(libPath):
+            return rfsoc.WaveformLibrary(libPath)
 
-                # Loop through the DAC's RAM depth
-                for x in range(self._bufferLength):
+        # One-time conversion of the CSV waveforms into the binary library format (scripts/sipmCsvToLib.py)
+        records = rfsoc.WaveformLibrary.readCsv(csvPath)
+        try:
+            rfsoc.WaveformLibrary.write(libPath, records, self._smplRate)
+            self._log.warning(f'Converted {csvPath} to waveform library {libPath}')
+            return rfsoc.WaveformLibrary(libPath)
+        except OSError as e:
+            # Read-only install: keep the CSV waveforms in memory
+            self._log.warning(f'Cannot write waveform library {libPath} ({e}), using {csvPath} from memory')
+            return rfsoc.WaveformLibrary.fromRecords(records, self._smplRate, path=csvPath)
 
-                    # Update only the shadow variable value (write performance reasons)
-                    self._DacSigGen.Waveform[0].set(value=int(self.sipmWave[self.sipmIdx][x]),index=x,write=False)
+    def _setTemplateGrid(self, gridStep):
+        # The memoized waveforms were composed from the templates of the previous grid
+        self._templates.setGridStep(gridStep)
+        self._synth.clearCache()
 
-                # Push all shadow variables to hardware
-                self._DacSigGen.Waveform[0].write()
+    def prepareWaveform(self):
+        start = time.perf_counter()
+        wave  = self._prepareWaveform()
+        self._prepareStats.record(time.perf_counter()-start, wave.nbytes)
+        return wave
 
-                # Reset the FSM after loading the waveform
-                self._DacSigGen.Reset()
+    def _prepareWaveform(self):
+
+        if self.RunMode.value():
+
+            with self._idxLock:
+                idx = self.sipmIdx
 
                 # Increment the index counter
                 self.sipmIdx = self.sipmIdx + 1
-                if self.sipmIdx==100:
+                if self.sipmIdx==len(self.sipmLib):
                     self.sipmIdx = 0
 
-            else:
-                # Zero out the array
-                wavesform = np.zeros(shape=self._bufferLength, dtype=np.float32, order='C')
+            # Copy out the previously recorded SiPM waveform
+            return self.sipmLib.waveform(idx, self._bufferLength)
+
+        else:
+            # Calculate the SiPM waveform (memoized on the photon parameters)
+            return self.calcWaveform()
+
+    def calcWaveform(self):
+        mode = self.EventMode.value()
+
+        if mode == 2:
+            # New random photons for every waveform (nothing to memoize)
+            A, B, C, T0 = self._generator.generate(
+                rate           = float(self.PhotonRate.value()),
+                amplitude      = float(self.PhotonAmplitude.value()),
+                amplitudeSigma = float(self.PhotonAmplitudeSigma.value()),
+                decay          = float(self.PhotonDecay.value()),
+                rise           = float(self.PhotonRise.value()),
+            )
+            self._eventCount = A.size
+            return self._synth.synthesize(A, B, C, T0)
+
+        if mode == 1:
+            events = [self.EventAmplitude.value(), self.EventDecay.value(), self.EventRise.value(), self.EventIncidentTime.value()]
+            if len(set(np.size(e) for e in events)) != 1:
+                raise ValueError('EventAmplitude, EventDecay, EventRise and EventIncidentTime must have the same length')
+        else:
+            events = [self.Amplitude.value(), self.Decay.value(), self.Rise.value(), self.IncidentTime.value()]
+        self._eventCount = np.size(events[0])
+
+        return self._synth.compute(
+            amplitude    = events[0],
+            decay        = events[1],
+            rise         = events[2],
+            incidentTime = events[3],
+        )
+
+    def setEvents(self, amplitude, decay, rise, incidentTime):
+        # Load a list of any number of events (scalars apply to every event) and select the List mode
+        A, B, C, T0 = np.broadcast_arrays(*[np.asarray(p, dtype=np.float32).reshape(-1) for p in [amplitude, decay, rise, incidentTime]])
+        self.EventAmplitude.set(A.copy())
+        self.EventDecay.set(B.copy())
+        self.EventRise.set(C.copy())
+        self.EventIncidentTime.set(T0.copy())
+        self.EventMode.set(1)
+
+    def calcWaveforms(self, amplitude, decay, rise, incidentTime):
+        # Synthesis of many (points x maxEvents) parameter sets
+        return self._synth.synthesizeBatch(amplitude, decay, rise, incidentTime)
 
-                # Loop through the photons
-                for i in range(self._maxEvents):
+    def writeWaveform(self, wave, reset=True):
+        wave  = np.asarray(wave, dtype=np.int16)
+        start = time.perf_counter()
 
-                    # Get photon signal's parameters
-                    A  = float(self.Amplitude.value(index=i))
-                    B  = self.Decay.value(index=i)
-                    C  = self.Rise.value(index=i)
-                    T0 = self.IncidentTime.value(index=i)
+        # Push the whole int16 buffer to the DAC RAM as a single block transaction
+        self._DacSigGen.Waveform[self._ch].set(value=wave, write=True)
+        written = time.perf_counter()
 
-                    # Loop through the DAC's RAM depth
-                    for x in range(self._bufferLength):
+        # Reset the FSM after loading the waveform (reset=False: the caller resets once for all the channels)
+        if reset:
+            self._DacSigGen.Reset()
+        stop = time.perf_counter()
 
-                        # Calculate the time and delta time
-                        t = float(x)*self._timeBin
-                        deltaT = t-T0
+        self._writeStats.record(written-start, wave.nbytes)
+        if reset:
+            self._resetStats.record(stop-written)
+        self.LoadTime.set(stop-start)
 
-                        # Check if time greater than incident time
-                        if (deltaT>0):
-                            # Calculate the waveform with superposition
-                            wavesform[x] += A*np.exp(-1.0*deltaT/B)*(1-np.exp(-1.0*deltaT/C))
+        # Keep a read-only copy of the buffer now in the DAC RAM for the readback monitors. The version
+        # only moves when the content changes, so rewriting the same waveform keeps their cached references
+        with self._loadedLock:
+            if not np.array_equal(wave, self._loadedWave):
+                loaded = wave.copy()
+                loaded.flags.writeable = False
+                self._loadedWave = loaded
+                self._loadedVer += 1
 
-                            # Check for overflow
-                            if (wavesform[x] > 32767.0):
-                                wavesform[x] = 32767.0
+        for listener in self._listeners:
+            listener(self._DacSigGen)
 
-                            # Check for underflow
-                            if (wavesform[x] < -32767.0):
-                                wavesform[x] = -32767.0
+    @property
+    def waveformVersion(self):
+        return self._loadedVer
 
-                # Loop through the DAC's RAM depth
-                for x in range(self._bufferLength):
+    def loadedWaveform(self):
+        # (version, int16 buffer) of the last waveform written to the DAC RAM
+        with self._loadedLock:
+            return self._loadedVer, self._loadedWave
 
-                    # Update only the shadow variable value (write performance reasons)
-                    self._DacSigGen.Waveform[0].set(value=int(wavesform[x]),index=x,write=False)
+    def markTriggered(self):
+        # Called at every DAC trigger: the ADC frames it produces come from the waveform loaded now
+        with self._loadedLock:
+            self._trigSeq += 1
+            self._triggers.append((self._trigSeq, time.monotonic(), self._loadedVer, self._loadedWave))
 
-                # Push all shadow variables to hardware
-                self._DacSigGen.Waveform[0].write()
+    def triggeredWaveforms(self):
+        # (sequence, monotonic time, version, int16 buffer) of the last triggers, oldest first
+        with self._loadedLock:
+            return list(self._triggers)
 
-                # Reset the FSM after loading the waveform
-                self._DacSigGen.Reset()
+    def addWriteListener(self, listener):
+        # listener(DacSigGen) is called after every waveform write
+        self._listeners.append(listener)
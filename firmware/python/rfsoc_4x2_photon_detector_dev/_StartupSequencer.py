@@ -0,0 +1,75 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import time
+import concurrent.futures
+
+class StartupSequencer(object):
+    def __init__(self, maxWorkers=4):
+        self._maxWorkers = maxWorkers
+        self._stages     = {}
+        self.timing      = {}
+
+    def add(self, name, function, deps=()):
+        # Stages run as soon as all the stages they depend on have completed
+        for dep in deps:
+            if dep not in self._stages:
+                raise ValueError(f'Stage {name} depends on unknown stage {dep}')
+        self._stages[name] = (function, tuple(deps))
+
+    def _timed(self, name, function, t0):
+        start = time.perf_counter()
+        try:
+            function()
+        finally:
+            stop = time.perf_counter()
+            self.timing[name] = (start-t0, stop-start)
+
+    def run(self, timeout=None):
+        # Raises TimeoutError if the stages are not all done within timeout seconds (None: no limit)
+        t0       = time.perf_counter()
+        deadline = None if timeout is None else time.monotonic()+timeout
+        done     = set()
+        running  = {}
+
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=self._maxWorkers, thread_name_prefix='startup')
+        try:
+            while len(done) < len(self._stages):
+
+                # Launch every stage whose dependencies are satisfied
+                for name, (function, deps) in self._stages.items():
+                    if (name not in done) and (name not in running.values()) and all(d in done for d in deps):
+                        running[pool.submit(self._timed, name, function, t0)] = name
+
+                remaining = None if deadline is None else max(0.0, deadline-time.monotonic())
+                finished, _ = concurrent.futures.wait(running, timeout=remaining, return_when=concurrent.futures.FIRST_COMPLETED)
+                if len(finished) == 0:
+                    raise TimeoutError(f'Startup stages {sorted(running.values())} still running after {timeout} seconds')
+
+                for future in finished:
+                    name = running.pop(future)
+                    # Re-raise the first failure once the other running stages are done (or the deadline)
+                    if future.exception() is not None:
+                        remaining = None if deadline is None else max(0.0, deadline-time.monotonic())
+                        concurrent.futures.wait(running, timeout=remaining)
+                        raise future.exception()
+                    done.add(name)
+        finally:
+            # Do not block on a stage still running after a failure or a timeout, and cancel the queued ones
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        self.timing['Total'] = (0.0, time.perf_counter()-t0)
+        return self.timing
+
+    def report(self):
+        lines = [f'{"Stage":<20} {"Start (s)":>10} {"Duration (s)":>13}']
+        for name, (start, duration) in sorted(self.timing.items(), key=lambda x: (x[0] == 'Total', x[1][0])):
+            lines.append(f'{name:<20} {start:>10.3f} {duration:>13.3f}')
+        return '\n'.join(lines)
@@ -0,0 +1,231 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import time
+import threading
+
+import pyrogue as pr
+
+import numpy as np
+
+class TriggerScheduler(pr.Device):
+    def __init__(self,
+            trigger = None, # Callable that loads the waveform and fires the DAC
+            rate    = 1.0,  # Units of Hz
+        **kwargs):
+        super().__init__(**kwargs)
+
+        self._trigger = trigger
+        self._thread  = None
+        self._wakeup  = threading.Event()
+        self._running = False
+        self._rng     = np.random.default_rng()
+        self._listIdx = 0
+
+        # Fired and missed triggers, the measured trigger rate and the lateness moments
+        self._count      = 0
+        self._missed     = 0
+        self._rateCount  = 0
+        self._rateStart  = time.monotonic()
+        self._achieved   = 0.0
+        self._latenessN  = 0
+        self._latenessM  = 0.0
+        self._latenessS  = 0.0
+
+        self.add(pr.LocalVariable(
+            name        = 'Enable',
+            description = 'Enable the software trigger scheduler (Root.start enables it once the startup is done)',
+            mode        = 'RW',
+            value       = False,
+            localSet    = lambda value: self._wakeup.set(),
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'Mode',
+            description = 'Fixed: constant period, Poisson: random exponential intervals, List: cycle through ArrivalList',
+            mode        = 'RW',
+            value       = 0,
+            enum        = {0: 'Fixed', 1: 'Poisson', 2: 'List'},
+            localSet    = lambda value: self._restartList(),
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'Rate',
+            description = 'Requested trigger rate for the Fixed and Poisson modes',
+            mode        = 'RW',
+            units       = 'Hz',
+            value       = rate,
+            minimum     = 0.0,
+            localSet    = lambda value: self._wakeup.set(),
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'ArrivalList',
+            description = 'Time intervals between triggers for the List mode',
+            mode        = 'RW',
+            typeStr     = 'Float[np]',
+            units       = 'seconds',
+            value       = np.full(shape=1, fill_value=1.0, dtype=np.float32, order='C'),
+            localSet    = lambda value: self._restartList(),
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'RequestedRate',
+            mode         = 'RO',
+            units        = 'Hz',
+            value        = 0.0,
+            disp         = '{:1.3f}',
+            localGet     = self._requestedRate,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'AchievedRate',
+            mode         = 'RO',
+            units        = 'Hz',
+            value        = 0.0,
+            disp         = '{:1.3f}',
+            localGet     = self._achievedRate,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'Jitter',
+            description  = 'Standard deviation of the trigger time with respect to its deadline',
+            mode         = 'RO',
+            units        = 'seconds',
+            value        = 0.0,
+            disp         = '{:1.3e}',
+            localGet     = lambda: np.sqrt(self._latenessS/self._latenessN) if self._latenessN > 1 else 0.0,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'TriggerCount',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._count,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'MissedDeadlines',
+            description  = 'Number of triggers that could not be issued before the following deadline',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._missed,
+            pollInterval = 1,
+        ))
+
+        @self.command(description='Reset the trigger statistics')
+        def CountReset():
+            self._count     = 0
+            self._missed    = 0
+            self._latenessN = 0
+            self._latenessM = 0.0
+            self._latenessS = 0.0
+
+    def _start(self):
+        super()._start()
+        self._running = True
+        self._thread  = threading.Thread(target=self._run, name=f'{self.path}.scheduler', daemon=True)
+        self._thread.start()
+
+    def _stop(self):
+        self._running = False
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        super()._stop()
+
+    def _restartList(self):
+        # The List mode starts over from ArrivalList[0] after a configuration change
+        self._listIdx = 0
+        self._wakeup.set()
+
+    def _requestedRate(self):
+        if self.Mode.value() == 2:
+            intervals = self.ArrivalList.value()
+            return 1.0/float(np.mean(intervals)) if (len(intervals) > 0) and (np.mean(intervals) > 0) else 0.0
+        return float(self.Rate.value())
+
+    def _achievedRate(self):
+        now = time.monotonic()
+        if (now-self._rateStart) >= 1.0:
+            self._achieved  = self._rateCount/(now-self._rateStart)
+            self._rateCount = 0
+            self._rateStart = now
+        return self._achieved
+
+    def _interval(self):
+        mode = self.Mode.value()
+
+        if mode == 2:
+            intervals = self.ArrivalList.value()
+            if len(intervals) == 0:
+                return None
+            idx = self._listIdx % len(intervals)
+            self._listIdx = idx+1
+            return float(intervals[idx])
+
+        rate = float(self.Rate.value())
+        if rate <= 0.0:
+            return None
+        elif mode == 1:
+            return float(self._rng.exponential(1.0/rate))
+        else:
+            return 1.0/rate
+
+    def _run(self):
+        deadline = None
+
+        while self._running:
+
+            # Idle until enabled with a valid rate
+            interval = self._interval() if self.Enable.value() else None
+            if interval is None:
+                deadline = None
+                self._wakeup.wait(0.1)
+                self._wakeup.clear()
+                continue
+
+            # Schedule relative to the previous deadline so errors do not accumulate
+            now      = time.monotonic()
+            deadline = (now if deadline is None else deadline) + interval
+
+            delay = deadline-time.monotonic()
+            if delay > 0 and self._wakeup.wait(delay):
+                # Configuration changed: restart the schedule
+                self._wakeup.clear()
+                deadline = None
+                continue
+
+            # Fire the trigger
+            lateness = time.monotonic()-deadline
+            try:
+                self._trigger()
+            except Exception as e:
+                self._log.exception(e)
+
+            self._count     += 1
+            self._rateCount += 1
+
+            # Running mean/variance of the trigger lateness (Welford)
+            self._latenessN += 1
+            delta            = lateness-self._latenessM
+            self._latenessM += delta/self._latenessN
+            self._latenessS += delta*(lateness-self._latenessM)
+
+            # Drop the deadlines that already passed instead of bursting to catch up
+            now = time.monotonic()
+            if now > deadline+interval:
+                self._missed += int((now-deadline)/interval)
+                deadline = now
@@ -0,0 +1,125 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import os
+
+import numpy as np
+
+# On-disk layout of a waveform library file:
+#   64 byte little-endian header (see WaveformLibraryHeader)
+#   count x recordLength contiguous little-endian int16 samples
+WaveformLibraryMagic   = b'SIPMWLIB'
+WaveformLibraryVersion = 1
+WaveformLibraryHeader  = np.dtype([
+    ('magic',        'S8'),
+    ('version',      '<u4'),
+    ('headerSize',   '<u4'),
+    ('sampleRate',   '<f8'),
+    ('recordLength', '<u4'),
+    ('count',        '<u4'),
+    ('reserved',     'V32'),
+])
+
+class WaveformLibrary(object):
+    def __init__(self, path):
+
+        self._path = path
+
+        header = np.fromfile(path, dtype=WaveformLibraryHeader, count=1)
+        if (header.size != 1) or (header['magic'][0] != WaveformLibraryMagic):
+            raise ValueError(f'{path} is not a SiPM waveform library file')
+        if header['version'][0] != WaveformLibraryVersion:
+            raise ValueError(f'{path}: unsupported waveform library version {header["version"][0]}')
+
+        self._sampleRate   = float(header['sampleRate'][0])
+        self._recordLength = int(header['recordLength'][0])
+        self._count        = int(header['count'][0])
+
+        # Map the sample block read-only: records are paged in from disk on access
+        self._data = np.memmap(
+            path,
+            dtype  = '<i2',
+            mode   = 'r',
+            offset = int(header['headerSize'][0]),
+            shape  = (self._count, self._recordLength),
+        )
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def sampleRate(self):
+        return self._sampleRate
+
+    @property
+    def recordLength(self):
+        return self._recordLength
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, idx):
+        return self._data[idx]
+
+    def waveform(self, idx, bufferLength):
+        # Copy a record into a zero padded DAC buffer
+        wave = np.zeros(shape=bufferLength, dtype=np.int16, order='C')
+        size = min(bufferLength, self._recordLength)
+        wave[:size] = self._data[idx,:size]
+        return wave
+
+    @staticmethod
+    def write(path, records, sampleRate):
+        records = np.ascontiguousarray(records, dtype='<i2')
+        if records.ndim != 2:
+            raise ValueError('records must be a 2-D (count x recordLength) array')
+
+        header = np.zeros(1, dtype=WaveformLibraryHeader)
+        header['magic']        = WaveformLibraryMagic
+        header['version']      = WaveformLibraryVersion
+        header['headerSize']   = WaveformLibraryHeader.itemsize
+        header['sampleRate']   = sampleRate
+        header['recordLength'] = records.shape[1]
+        header['count']        = records.shape[0]
+
+        # Write to a temporary file first so readers never map a partial library
+        tmp = f'{path}.tmp'
+        try:
+            with open(tmp, 'wb') as f:
+                header.tofile(f)
+                records.tofile(f)
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    @staticmethod
+    def readCsv(csvPath):
+        # CSV file with one waveform per row
+        return np.loadtxt(csvPath, delimiter=',', dtype=np.int16, ndmin=2)
+
+    @staticmethod
+    def fromCsv(csvPath, path, sampleRate=8.128E+9):
+        # One-time import of a CSV file with one waveform per row
+        WaveformLibrary.write(path, WaveformLibrary.readCsv(csvPath), sampleRate)
+        return WaveformLibrary(path)
+
+    @classmethod
+    def fromRecords(cls, records, sampleRate, path=''):
+        # In-memory library (no file), e.g. when the converted library cannot be written
+        lib = cls.__new__(cls)
+        lib._path         = path
+        lib._data         = np.ascontiguousarray(records, dtype='<i2')
+        lib._sampleRate   = float(sampleRate)
+        lib._count        = lib._data.shape[0]
+        lib._recordLength = lib._data.shape[1]
+        return lib
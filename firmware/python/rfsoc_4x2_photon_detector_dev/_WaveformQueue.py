@@ -0,0 +1,212 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import time
+import threading
+import collections
+
+import pyrogue as pr
+
+class WaveformQueue(pr.Device):
+    def __init__(self,
+            source   = None, # Callable that returns the next int16 waveform buffer
+            capacity = 8,    # Number of waveforms prepared ahead of the trigger
+        **kwargs):
+        super().__init__(**kwargs)
+
+        self._source     = source
+        self._capacity   = capacity
+        self._queue      = collections.deque()
+        self._cond       = threading.Condition()
+        self._generation = 0
+        self._thread     = None
+        self._running    = False
+        self._failed     = -1 # Generation whose producer raised, not retried until the next flush
+        self._error      = ''
+
+        # Underruns, records through the queue and the producer/dequeue/write latencies
+        self._underruns      = 0
+        self._produced       = 0
+        self._consumed       = 0
+        self._produceLatency = 0.0
+        self._dequeueLatency = 0.0
+        self._writeLatency   = 0.0
+
+        self.add(pr.LocalVariable(
+            name        = 'Enable',
+            description = 'True: prepare waveforms in a background thread, False: prepare them on the trigger',
+            mode        = 'RW',
+            value       = True,
+            localSet    = lambda value, changed: self.flush() if changed else None,
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'Capacity',
+            description = 'Number of waveforms prepared ahead of the trigger',
+            mode        = 'RO',
+            value       = capacity,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'Depth',
+            description  = 'Number of ready waveforms in the queue',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: len(self._queue),
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'Produced',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._produced,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'Consumed',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._consumed,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'Underruns',
+            description  = 'Number of triggers that found the queue empty',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self._underruns,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'Error',
+            description  = 'Last error of the background producer, which stops until the next flush (parameter change)',
+            mode         = 'RO',
+            value        = '',
+            localGet     = lambda: self._error,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'ProduceLatency',
+            description  = 'Time to prepare the last waveform (synthesis or library lookup)',
+            mode         = 'RO',
+            units        = 'seconds',
+            value        = 0.0,
+            disp         = '{:1.3e}',
+            localGet     = lambda: self._produceLatency,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'DequeueLatency',
+            description  = 'Time for the trigger path to get the last waveform',
+            mode         = 'RO',
+            units        = 'seconds',
+            value        = 0.0,
+            disp         = '{:1.3e}',
+            localGet     = lambda: self._dequeueLatency,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'WriteLatency',
+            description  = 'Time for the trigger path to write the last waveform to hardware',
+            mode         = 'RO',
+            units        = 'seconds',
+            value        = 0.0,
+            disp         = '{:1.3e}',
+            localGet     = lambda: self._writeLatency,
+            pollInterval = 1,
+        ))
+
+        @self.command(description='Reset the queue statistics')
+        def CountReset():
+            self._underruns = 0
+            self._produced  = 0
+            self._consumed  = 0
+
+    def _start(self):
+        super()._start()
+        self._running = True
+        self._thread  = threading.Thread(target=self._run, name=f'{self.path}.producer', daemon=True)
+        self._thread.start()
+
+    def _stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        super()._stop()
+
+    def flush(self):
+        # Drop the prepared waveforms (e.g. after a waveform parameter change) and retry a failed producer.
+        # The dropped waveforms are not replayed: a source that advances on every call (library records)
+        # skips the ones that were prepared but not consumed
+        with self._cond:
+            self._generation += 1
+            self._error = ''
+            self._queue.clear()
+            self._cond.notify_all()
+
+    def pop(self):
+        start = time.perf_counter()
+
+        with self._cond:
+            wave = self._queue.popleft() if (self._running and self._queue) else None
+            self._cond.notify_all()
+
+        if wave is None:
+            # Underrun: prepare the waveform on the trigger path
+            if self._running and self.Enable.value():
+                self._underruns += 1
+            wave = self._source()
+
+        self._consumed      += 1
+        self._dequeueLatency = time.perf_counter()-start
+        return wave
+
+    def recordWrite(self, latency):
+        self._writeLatency = latency
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and ((len(self._queue) >= self._capacity) or not self.Enable.value() or (self._failed == self._generation)):
+                    self._cond.wait(0.1)
+                if not self._running:
+                    return
+                generation = self._generation
+
+            start = time.perf_counter()
+            try:
+                wave = self._source()
+            except Exception as e:
+                # Same parameters, same error: report it once and wait for a flush
+                with self._cond:
+                    stale = (generation != self._generation)
+                    if not stale:
+                        self._failed = generation
+                        self._error  = f'{type(e).__name__}: {e}'
+                if not stale:
+                    self._log.exception(e)
+                continue
+            self._produceLatency = time.perf_counter()-start
+
+            with self._cond:
+                # Discard waveforms prepared before the last flush
+                if generation == self._generation:
+                    self._queue.append(wave)
+                    self._produced += 1
@@ -1,4 +1,25 @@
-from rfsoc_4x2_photon_detector_dev._SigGenLoader import *
-from rfsoc_4x2_photon_detector_dev._Application  import *
-from rfsoc_4x2_photon_detector_dev._RFSoC        import *
-from rfsoc_4x2_photon_detector_dev._Root         import *
+from rfsoc_4x2_photon_detector_dev._Instrumentation     import *
+from rfsoc_4x2_photon_detector_dev._PulseTemplates      import *
+from rfsoc_4x2_photon_detector_dev._PhotonGenerator     import *
+from rfsoc_4x2_photon_detector_dev._PulseSynthesizer    import *
+from rfsoc_4x2_photon_detector_dev._WaveformLibrary     import *
+from rfsoc_4x2_photon_detector_dev._WaveformQueue       import *
+from rfsoc_4x2_photon_detector_dev._CommandWorker       import *
+from rfsoc_4x2_photon_detector_dev._SigGenLoader        import *
+from rfsoc_4x2_photon_detector_dev._TriggerScheduler    import *
+from rfsoc_4x2_photon_detector_dev._ScanEngine          import *
+from rfsoc_4x2_photon_detector_dev._FrameBuffer         import *
+from rfsoc_4x2_photon_detector_dev._PulseAnalyzer       import *
+from rfsoc_4x2_photon_detector_dev._ResidualMonitor     import *
+from rfsoc_4x2_photon_detector_dev._FrameDownsampler    import *
+from rfsoc_4x2_photon_detector_dev._HardwareEmulator    import *
+from rfsoc_4x2_photon_detector_dev._RecordFile          import *
+from rfsoc_4x2_photon_detector_dev._ChunkedRecorder     import *
+from rfsoc_4x2_photon_detector_dev._SharedRing          import *
+from rfsoc_4x2_photon_detector_dev._SharedRingPublisher import *
+from rfsoc_4x2_photon_detector_dev._PvPublisher         import *
+from rfsoc_4x2_photon_detector_dev._Application         import *
+from rfsoc_4x2_photon_detector_dev._StartupSequencer    import *
+from rfsoc_4x2_photon_detector_dev._IncrementalReader   import *
+from rfsoc_4x2_photon_detector_dev._RFSoC               import *
+from rfsoc_4x2_photon_detector_dev._Root                import *
@@ -0,0 +1,54 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import numpy as np
+import pytest
+
+from _PulseSynthesizer import PulseSynthesizer
+
+def test_singlePulse():
+    synth = PulseSynthesizer()
+    wave  = synth.synthesize(np.array([8000.0]), np.array([100.0E-9]), np.array([10.0E-9]), np.array([10.0E-9]))
+    t     = np.arange(synth.bufferLength)/synth.sampleRate - 10.0E-9
+    ref   = np.where(t > 0, 8000.0*np.exp(-t/100.0E-9)*(1.0-np.exp(-t/10.0E-9)), 0.0)
+    assert wave.dtype == np.int16
+    assert np.max(np.abs(wave-ref)) <= 1.0
+
+def test_clipsToInt16():
+    synth = PulseSynthesizer()
+    wave  = synth.synthesize(np.array([1.0E6]), np.array([100.0E-9]), np.array([1.0E-9]), np.array([0.0]))
+    assert wave.max() == 32767
+
+def test_zeroAmplitudeIgnored():
+    synth = PulseSynthesizer()
+    wave  = synth.synthesize(np.array([0.0]), np.array([0.0]), np.array([0.0]), np.array([0.0]))
+    assert not np.any(wave)
+
+def test_nonPositiveTimeConstant():
+    synth = PulseSynthesizer()
+    with pytest.raises(ValueError):
+        synth.synthesize(np.array([100.0]), np.array([0.0]), np.array([1.0E-9]), np.array([0.0]))
+
+def test_computeMemoized():
+    synth = PulseSynthesizer(cacheSize=1)
+    first = synth.compute([8000.0], [100.0E-9], [10.0E-9], [10.0E-9])
+    again = synth.compute([8000.0], [100.0E-9], [10.0E-9], [10.0E-9])
+    assert again is first
+    assert (synth.cacheHits, synth.cacheMisses) == (1, 1)
+    assert not first.flags.writeable
+
+def test_batchMatchesSynthesize():
+    rng   = np.random.default_rng(2)
+    synth = PulseSynthesizer()
+    A, B, C, T0 = (rng.uniform(100.0, 8000.0, (3, 5)), rng.uniform(20.0E-9, 200.0E-9, (3, 5)),
+                   rng.uniform(1.0E-9, 20.0E-9, (3, 5)), rng.uniform(0.0, 900.0E-9, (3, 5)))
+    waves = synth.synthesizeBatch(A, B, C, T0)
+    for p in range(3):
+        assert np.array_equal(waves[p], synth.synthesize(A[p], B[p], C[p], T0[p]))
@@ -0,0 +1,48 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import numpy as np
+import pytest
+
+from _PulseTemplates import PulseTemplateStore
+from _PulseSynthesizer import PulseSynthesizer
+
+def events(n, decay, rise, seed=1):
+    rng = np.random.default_rng(seed)
+    return (rng.uniform(100.0, 300.0, n), np.resize(np.asarray(decay, dtype=np.float64), n),
+            np.full(n, rise), rng.uniform(0.0, 900.0E-9, n))
+
+@pytest.mark.parametrize('decay', [[100.0E-9], [100.0E-9, 50.0E-9]])
+def test_composeFftMatchesDirect(decay):
+    # More than fftEvents events per template go through the FFT convolution
+    A, B, C, T0 = events(100, decay, 10.0E-9)
+    fft    = PulseTemplateStore(fftEvents=32).compose(A, B, C, T0)
+    direct = PulseTemplateStore(fftEvents=10**9).compose(A, B, C, T0)
+    assert np.max(np.abs(fft-direct)) < 1.0E-3
+
+def test_templatesMatchExactSynthesis():
+    A, B, C, T0 = events(100, [100.0E-9, 50.0E-9], 10.0E-9)
+    exact     = PulseSynthesizer().synthesize(A, B, C, T0)
+    templates = PulseSynthesizer(templates=PulseTemplateStore(gridStep=0)).synthesize(A, B, C, T0)
+    assert np.max(np.abs(exact.astype(np.int32)-templates)) <= 1
+
+def test_composeSkipsInactiveEvents():
+    store = PulseTemplateStore()
+    A, B, C, T0 = events(4, [100.0E-9], 10.0E-9)
+    A[0]  = 0.0
+    T0[1] = 1.0 # After the end of the buffer
+    full  = store.compose(A, B, C, T0)
+    part  = store.compose(A[2:], B[2:], C[2:], T0[2:])
+    assert np.array_equal(full, part)
+
+def test_quantizeRejectsNonPositive():
+    store = PulseTemplateStore()
+    with pytest.raises(ValueError):
+        store.quantize(0.0)
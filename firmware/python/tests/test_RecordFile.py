@@ -0,0 +1,57 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import numpy as np
+import pytest
+
+import _RecordFile as rf
+
+def writeRecording(path, codec, frames, framesPerChunk):
+    # Chunks and index entries laid out as the ChunkedRecorder writes them
+    index = []
+    with open(path, 'wb') as f:
+        for first in range(0, len(frames), framesPerChunk):
+            chunk  = [x.view(np.uint8) for x in frames[first:first+framesPerChunk]]
+            offset = f.tell()
+            f.write(rf.encodeChunk(codec, 0, chunk))
+            start = 0
+            for k, data in enumerate(chunk):
+                entry = np.zeros(1, dtype=rf.RecordIndexEntry)
+                entry['frame']     = first+k
+                entry['chFrame']   = first+k
+                entry['timestamp'] = 100.0+first+k
+                entry['size']      = data.size
+                entry['chunk']     = offset
+                entry['offset']    = start
+                index.append(entry)
+                start += data.size
+    np.concatenate(index).tofile(path+rf.RecordIndexSuffix)
+
+def test_deltaRoundTrip():
+    samples = np.array([0, 32767, -32768, 5, -5, 32767], dtype=np.int16)
+    assert np.array_equal(rf.deltaDecode(rf.deltaEncode(samples)), samples)
+
+@pytest.mark.parametrize('codec', ['none', 'zlib'])
+def test_recordRoundTrip(tmp_path, codec):
+    rng    = np.random.default_rng(3)
+    frames = [rng.integers(-2000, 2000, 64+16*k).astype(np.int16) for k in range(7)]
+    path   = str(tmp_path/'record.dat')
+    writeRecording(path, rf.recordCodec(codec), frames, 3)
+
+    with rf.RecordReader(path, cacheChunks=1) as reader:
+        assert len(reader) == len(frames)
+        assert list(reader.channels) == [0]
+        for n in [6, 0, 4, 1]:
+            assert np.array_equal(reader.samples(n), frames[n])
+        assert reader.find(103.5) == 4
+
+def test_unknownCodec():
+    with pytest.raises(ValueError):
+        rf.recordCodec('gzip')
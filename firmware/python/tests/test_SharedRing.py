@@ -0,0 +1,59 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import os
+
+import numpy as np
+import pytest
+
+from _SharedRing import SharedRingWriter, SharedRingReader
+
+@pytest.fixture
+def ring():
+    writer = SharedRingWriter(f'sipm_test_{os.getpid()}', slots=4, slotSamples=16, sampleRate=1.0E9)
+    reader = SharedRingReader(writer.name)
+    yield writer, reader
+    reader.close()
+    writer.close()
+    writer.unlink()
+
+def test_publishRead(ring):
+    writer, reader = ring
+    n = writer.publish(np.arange(10), timestamp=5.0)
+    data, ts = reader.read(n)
+    assert np.array_equal(data, np.arange(10))
+    assert ts == 5.0
+    assert reader.sampleRate == 1.0E9
+
+def test_frameBeingWritten(ring):
+    # The slot sequence is odd while the frame is written: readers do not see it
+    writer, reader = ring
+    n, slot = writer.beginFrame()
+    slot[:4] = 7
+    assert reader.read(n) is None
+    writer.endFrame(n, 4, 1.0)
+    assert np.array_equal(reader.read(n)[0], [7, 7, 7, 7])
+
+def test_overwrittenFrame(ring):
+    writer, reader = ring
+    for k in range(6):
+        writer.publish([k])
+    assert reader.read(0) is None
+    assert reader.read(1) is None
+    assert reader.oldest() == 3
+    assert [int(x[1][0]) for x in reader.follow(start=0, timeout=0.0)] == [3, 4, 5]
+
+def test_viewInvalidatedByWriter(ring):
+    writer, reader = ring
+    n = writer.publish([1, 2, 3])
+    view, _ = reader.view(n)
+    for k in range(writer.slots):
+        writer.publish([k])
+    assert not reader.check(n)
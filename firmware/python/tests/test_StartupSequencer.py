@@ -0,0 +1,85 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import time
+import threading
+
+import pytest
+
+from _StartupSequencer import StartupSequencer
+
+def startupThreads():
+    return [t for t in threading.enumerate() if t.name.startswith('startup')]
+
+def test_dependencyOrder():
+    seq   = StartupSequencer()
+    order = []
+    lock  = threading.Lock()
+
+    def stage(name, delay=0.0):
+        def run():
+            time.sleep(delay)
+            with lock:
+                order.append(name)
+        return run
+
+    seq.add('A', stage('A', 0.05))
+    seq.add('B', stage('B'), deps=['A'])
+    seq.add('C', stage('C', 0.02))
+    seq.add('D', stage('D'), deps=['B', 'C'])
+    timing = seq.run()
+
+    assert order.index('A') < order.index('B') < order.index('D')
+    assert order.index('C') < order.index('D')
+    assert set(timing) == {'A', 'B', 'C', 'D', 'Total'}
+
+    # Independent stages overlap, dependent ones start after their dependencies ended
+    assert timing['C'][0] < timing['A'][0]+timing['A'][1]
+    assert timing['B'][0] >= timing['A'][0]+timing['A'][1]
+
+def test_unknownDependency():
+    seq = StartupSequencer()
+    with pytest.raises(ValueError):
+        seq.add('B', lambda: None, deps=['A'])
+
+def test_failureSkipsDependents():
+    seq = StartupSequencer()
+    ran = []
+
+    def fail():
+        raise RuntimeError('stage failed')
+
+    seq.add('A', fail)
+    seq.add('B', lambda: ran.append('B'), deps=['A'])
+    with pytest.raises(RuntimeError):
+        seq.run()
+    assert ran == []
+
+def test_timeout():
+    seq     = StartupSequencer(maxWorkers=1)
+    release = threading.Event()
+    ran     = []
+
+    # The first stage hangs: the second one is queued behind it on the single worker
+    seq.add('Hang',   lambda: release.wait(5.0))
+    seq.add('Queued', lambda: ran.append('Queued'))
+
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        seq.run(timeout=0.1)
+    assert time.monotonic()-start < 1.0
+
+    # The pool is shut down: the queued stage never runs and the workers exit once the hung stage returns
+    release.set()
+    stop = time.monotonic()+2.0
+    while startupThreads() and (time.monotonic() < stop):
+        time.sleep(0.01)
+    assert startupThreads() == []
+    assert ran == []
@@ -0,0 +1,23 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import numpy as np
+
+def stats(values):
+    # Mean/min/median/p99/max of a sample list, as a JSON friendly dictionary ({} when empty)
+    values = np.asarray(values, dtype=np.float64)
+    if values.size == 0:
+        return {}
+    return {
+        'mean' : float(np.mean(values)),
+        'min'  : float(np.min(values)),
+        'p50'  : float(np.percentile(values, 50)),
+        'p99'  : float(np.percentile(values, 99)),
+        'max'  : float(np.max(values)),
+    }
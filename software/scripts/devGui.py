@@ -18,6 +18,9 @@ import importlib
 import rogue
 import axi_soc_ultra_plus_core.rfsoc_utility.pydm
 
+# Convert str to bool
+argBool = lambda s: s.lower() in ['true', 't', 'yes', '1']
+
 if __name__ == "__main__":
 
 #################################################################
@@ -34,6 +37,44 @@ if __name__ == "__main__":
         help     = "ETH Host Name (or IP address)",
     )
 
+    parser.add_argument(
+        "--emulate",
+        action   = 'store_true',
+        help     = "Target the hardware emulator instead of the RFSoC",
+    )
+
+    parser.add_argument(
+        "--emuLocal",
+        type     = argBool,
+        required = False,
+        default  = True,
+        help     = "True: run the emulator in this process, False: connect to scripts/hwEmulator.py at --ip",
+    )
+
+    parser.add_argument(
+        "--numCh",
+        type     = int,
+        required = False,
+        default  = 1,
+        help     = "Number of ADC/DAC channels",
+    )
+
+    parser.add_argument(
+        "--shmPrefix",
+        type     = str,
+        required = False,
+        default  = None,
+        help     = "Publish the ring buffers to the shared memory rings <shmPrefix>_adc<i>/_dac<i> (see scripts/shmConsumer.py)",
+    )
+
+    parser.add_argument(
+        "--sipmLibrary",
+        type     = str,
+        required = False,
+        default  = 'config/SipmWave8GSPS.wlib',
+        help     = "Binary library of recorded SiPM waveforms (see scripts/sipmCsvToLib.py)",
+    )
+
     parser.add_argument(
         "--defaultFile",
         type     = str,
@@ -55,13 +96,18 @@ if __name__ == "__main__":
     with rfsoc_4x2_photon_detector_dev.Root(
         ip          = args.ip,
         defaultFile = args.defaultFile,
+        emulate     = args.emulate,
+        emuLocal    = args.emuLocal,
+        numCh       = args.numCh,
+        shmPrefix   = args.shmPrefix,
+        sipmLibrary = args.sipmLibrary,
     ) as root:
         axi_soc_ultra_plus_core.rfsoc_utility.pydm.runPyDM(
             serverList = root.zmqServer.address,
             ui         = ui,
             sizeX      = 800,
             sizeY      = 800,
-            numAdcCh   = 1,
-            numDacCh   = 1,
+            numAdcCh   = args.numCh,
+            numDacCh   = args.numCh,
         )
     #################################################################
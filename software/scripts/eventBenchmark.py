@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import setupLibPaths
+import rfsoc_4x2_photon_detector_dev
+
+from benchmarkStats import stats
+
+import json
+import time
+import argparse
+
+import numpy as np
+
+#################################################################
+
+def timeIt(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter()-start)
+    return stats(times)
+
+#################################################################
+
+if __name__ == "__main__":
+
+    # Set the argument parser
+    parser = argparse.ArgumentParser()
+
+    # Add arguments
+    parser.add_argument(
+        "--ip",
+        type     = str,
+        required = False,
+        default  = '10.0.0.10',
+        help     = "ETH Host Name (or IP address)",
+    )
+
+    parser.add_argument(
+        "--emulate",
+        action   = 'store_true',
+        help     = "Run against the local hardware emulator instead of the RFSoC",
+    )
+
+    parser.add_argument(
+        "--offline",
+        action   = 'store_true',
+        help     = "Only time the waveform synthesis (no Root, no hardware)",
+    )
+
+    parser.add_argument(
+        "--defaultFile",
+        type     = str,
+        required = False,
+        default  = 'config/defaults.yml',
+        help     = "Sets the default YAML configuration file to be loaded at the root.start()",
+    )
+
+    parser.add_argument(
+        "--events",
+        type     = int,
+        nargs    = '+',
+        required = False,
+        default  = [1, 4, 16, 64, 256, 1024, 4096],
+        help     = "Number of events per waveform to sweep",
+    )
+
+    parser.add_argument(
+        "--directMax",
+        type     = int,
+        required = False,
+        default  = 1024,
+        help     = "Largest event count also timed with the direct (events x samples) exp() evaluation",
+    )
+
+    parser.add_argument(
+        "--repeat",
+        type     = int,
+        required = False,
+        default  = 20,
+        help     = "Number of waveforms timed per sweep point",
+    )
+
+    parser.add_argument(
+        "--output",
+        type     = str,
+        required = False,
+        default  = 'eventBenchmark.json',
+        help     = "Machine readable (JSON) results file",
+    )
+
+    # Get the arguments
+    args = parser.parse_args()
+
+    #################################################################
+
+    rng    = np.random.default_rng(1)
+    direct = rfsoc_4x2_photon_detector_dev.PulseSynthesizer()
+    tpl    = rfsoc_4x2_photon_detector_dev.PulseSynthesizer(templates=rfsoc_4x2_photon_detector_dev.PulseTemplateStore())
+    window = direct.bufferLength/direct.sampleRate
+
+    def eventList(count):
+        # Photons spread over the buffer, with the pileup of the preceding 500 ns
+        return (
+            rng.normal(300.0, 30.0, size=count),
+            np.full(count, 100.0E-9),
+            np.full(count, 10.0E-9),
+            rng.uniform(-500.0E-9, window, size=count),
+        )
+
+    def sweep(load=None):
+        points = []
+        for count in args.events:
+            events = eventList(count)
+            point  = {
+                'events'   : count,
+                'template' : timeIt(lambda: tpl.synthesize(*events), args.repeat),
+                'direct'   : timeIt(lambda: direct.synthesize(*events), args.repeat) if count <= args.directMax else {},
+            }
+            if load is not None:
+                point['load'] = timeIt(load(count), args.repeat)
+            points.append(point)
+            print(f"{count:6d} events: template={point['template']['mean']:.3e}s "
+                  f"direct={point['direct'].get('mean', float('nan')):.3e}s"
+                  + (f" load={point['load']['mean']:.3e}s" if load is not None else ''))
+        return points
+
+    if args.offline:
+        points = sweep()
+        target = 'offline'
+
+    else:
+        with rfsoc_4x2_photon_detector_dev.Root(
+            ip          = args.ip,
+            defaultFile = args.defaultFile,
+            emulate     = args.emulate,
+            zmqSrvEn    = False,
+            pollEn      = False,
+            softTrigger = False, # Only the benchmark loads waveforms
+        ) as root:
+
+            app    = root.RFSoC.Application
+            loader = app.sigGenLoaders[0]
+
+            loader.RunMode.set(False)
+            loader.EventMode.set(2)
+            loader.PhotonAmplitude.set(300.0)
+            loader.PhotonDecay.set(100.0E-9)
+            loader.PhotonRise.set(10.0E-9)
+
+            def load(count):
+                # End to end with new Poisson photons every time (mean count over the buffer and
+                # its pileup lead): synthesis, RAM write and FSM reset
+                loader.PhotonRate.set(count/(window+5*100.0E-9))
+                return lambda: loader.writeWaveform(loader.calcWaveform())
+
+            points = sweep(load)
+            target = 'emulator' if args.emulate else args.ip
+
+    result = {
+        'target'  : target,
+        'created' : time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'points'  : points,
+    }
+
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f'Wrote {args.output}')
+
+    #################################################################
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import setupLibPaths
+import rfsoc_4x2_photon_detector_dev
+
+import time
+import argparse
+
+import pyrogue as pr
+
+if __name__ == "__main__":
+
+#################################################################
+
+    # Set the argument parser
+    parser = argparse.ArgumentParser()
+
+    # Add arguments
+    parser.add_argument(
+        "--host",
+        type     = str,
+        required = False,
+        default  = '127.0.0.1',
+        help     = "Address to serve the emulated register map and ring buffer streams on",
+    )
+
+    parser.add_argument(
+        "--numCh",
+        type     = int,
+        required = False,
+        default  = 1,
+        help     = "Number of ADC/DAC channels",
+    )
+
+    parser.add_argument(
+        "--frameRate",
+        type     = float,
+        required = False,
+        default  = 0.0,
+        help     = "Free running ring buffer frame rate (units of Hz, 0: only on StartDacFlag)",
+    )
+
+    parser.add_argument(
+        "--noise",
+        type     = float,
+        required = False,
+        default  = 8.0,
+        help     = "ADC noise RMS (units of counts)",
+    )
+
+    parser.add_argument(
+        "--dspResetTime",
+        type     = float,
+        required = False,
+        default  = 0.1,
+        help     = "Time DspReset stays asserted after start (units of seconds)",
+    )
+
+    # Get the arguments
+    args = parser.parse_args()
+
+    #################################################################
+
+    emulator = rfsoc_4x2_photon_detector_dev.HardwareEmulator(
+        host         = args.host,
+        numCh        = args.numCh,
+        frameRate    = args.frameRate,
+        noise        = args.noise,
+        dspResetTime = args.dspResetTime,
+    )
+
+    # Build (but do not start) the device tree to resolve the emulated register addresses
+    tree = pr.Root(name='Root', pollEn=False)
+    tree.add(rfsoc_4x2_photon_detector_dev.RFSoC(
+        memBase = emulator.memory,
+        offset  = 0x04_0000_0000, # Full 40-bit address space
+        numCh   = args.numCh,
+    ))
+    emulator.attach(tree.RFSoC)
+
+    emulator._start()
+    print(f'Serving the RFSoC emulator on {args.host} (ctrl-c to exit)')
+    try:
+        while True:
+            time.sleep(1.0)
+            print(f'triggers={emulator.triggerCount} frames={emulator.frameCount}', end='\r')
+    except KeyboardInterrupt:
+        pass
+    emulator._stop()
+
+    #################################################################
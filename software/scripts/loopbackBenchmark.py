@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import setupLibPaths
+import rfsoc_4x2_photon_detector_dev
+
+from benchmarkStats import stats
+
+import sys
+import json
+import time
+import queue
+import argparse
+import itertools
+
+import numpy as np
+
+import rogue.interfaces.stream
+
+#################################################################
+
+class FrameCatcher(rogue.interfaces.stream.Slave):
+    def __init__(self):
+        rogue.interfaces.stream.Slave.__init__(self)
+        self.frames = queue.Queue()
+
+    def _acceptFrame(self, frame):
+        stamp = time.perf_counter()
+        with frame.lock():
+            data = frame.getNumpy(0, frame.getPayload()).view(np.int16).copy()
+        self.frames.put((stamp, data))
+
+    def flush(self):
+        while not self.frames.empty():
+            self.frames.get_nowait()
+
+def readbackError(adc, dac, decimation):
+    # Reference: DAC waveform at the ADC sample rate
+    ref = dac[::decimation].astype(np.float64)
+    adc = adc.astype(np.float64)
+    size = min(ref.size, adc.size)
+    ref, adc = ref[:size], adc[:size]
+
+    # Align with the circular cross-correlation peak
+    xcorr = np.fft.irfft(np.fft.rfft(adc)*np.conj(np.fft.rfft(ref)), n=size)
+    delay = int(np.argmax(xcorr))
+    ref   = np.roll(ref, delay)
+
+    # Least squares gain, then the residual RMS relative to the reference RMS
+    norm  = np.dot(ref, ref)
+    gain  = np.dot(adc, ref)/norm if norm > 0 else 0.0
+    rms   = np.sqrt(np.mean((adc-gain*ref)**2))
+    ref   = np.sqrt(norm/size)
+    delay = delay if delay <= size//2 else delay-size
+    return (rms/ref if ref > 0 else 0.0), gain, delay
+
+#################################################################
+
+if __name__ == "__main__":
+
+    # Set the argument parser
+    parser = argparse.ArgumentParser()
+
+    # Add arguments
+    parser.add_argument(
+        "--ip",
+        type     = str,
+        required = False,
+        default  = '10.0.0.10',
+        help     = "ETH Host Name (or IP address)",
+    )
+
+    parser.add_argument(
+        "--emulate",
+        action   = 'store_true',
+        help     = "Run against the local hardware emulator instead of the RFSoC",
+    )
+
+    parser.add_argument(
+        "--defaultFile",
+        type     = str,
+        required = False,
+        default  = 'config/defaults.yml',
+        help     = "Sets the default YAML configuration file to be loaded at the root.start()",
+    )
+
+    parser.add_argument(
+        "--amplitude",
+        type     = int,
+        nargs    = '+',
+        required = False,
+        default  = [4000, 10000, 20000],
+        help     = "Pulse amplitudes to sweep (units of counts)",
+    )
+
+    parser.add_argument(
+        "--decay",
+        type     = float,
+        nargs    = '+',
+        required = False,
+        default  = [20.0E-9, 100.0E-9],
+        help     = "Pulse decay times to sweep (units of seconds)",
+    )
+
+    parser.add_argument(
+        "--rise",
+        type     = float,
+        nargs    = '+',
+        required = False,
+        default  = [2.0E-9, 10.0E-9],
+        help     = "Pulse rise times to sweep (units of seconds)",
+    )
+
+    parser.add_argument(
+        "--incidentTime",
+        type     = float,
+        required = False,
+        default  = 100.0E-9,
+        help     = "Pulse incident time (units of seconds)",
+    )
+
+    parser.add_argument(
+        "--repeat",
+        type     = int,
+        required = False,
+        default  = 20,
+        help     = "Number of load/trigger/readback cycles per sweep point",
+    )
+
+    parser.add_argument(
+        "--timeout",
+        type     = float,
+        required = False,
+        default  = 1.0,
+        help     = "Time to wait for the ADC frame after a trigger (units of seconds)",
+    )
+
+    parser.add_argument(
+        "--output",
+        type     = str,
+        required = False,
+        default  = 'loopbackBenchmark.json',
+        help     = "Machine readable (JSON) results file",
+    )
+
+    # Get the arguments
+    args = parser.parse_args()
+
+    #################################################################
+
+    with rfsoc_4x2_photon_detector_dev.Root(
+        ip          = args.ip,
+        defaultFile = args.defaultFile,
+        emulate     = args.emulate,
+        zmqSrvEn    = False,
+        pollEn      = False,
+        softTrigger = False, # Only the benchmark triggers the DAC
+    ) as root:
+
+        app    = root.RFSoC.Application
+        loader = app.sigGenLoaders[0]
+        events = len(loader.Amplitude.value())
+
+        loader.RunMode.set(False)
+
+        catcher = FrameCatcher()
+        root.ringBufferAdc[0] >> catcher
+
+        points = []
+        for amplitude, decay, rise in itertools.product(args.amplitude, args.decay, args.rise):
+
+            # Single photon at the incident time
+            amp = np.zeros(events, dtype=np.int16)
+            amp[0] = amplitude
+            loader.Amplitude.set(amp)
+            loader.Decay.set(np.full(events, decay, dtype=np.float32))
+            loader.Rise.set(np.full(events, rise, dtype=np.float32))
+            loader.IncidentTime.set(np.full(events, args.incidentTime, dtype=np.float32))
+
+            dac = np.asarray(loader.calcWaveform())
+            loadTime, latency, error, gain, delay = [], [], [], [], []
+            missed = 0
+
+            catcher.flush()
+            start = time.perf_counter()
+
+            for _ in range(args.repeat):
+
+                # Load the waveform
+                t0 = time.perf_counter()
+                loader.LoadWaveform()
+                loadTime.append(time.perf_counter()-t0)
+
+                # Trigger and wait for the ADC frame
+                t0 = time.perf_counter()
+                app.startDac()
+                try:
+                    stamp, adc = catcher.frames.get(timeout=args.timeout)
+                except queue.Empty:
+                    missed += 1
+                    continue
+                latency.append(stamp-t0)
+
+                err, g, d = readbackError(adc, dac, decimation=4)
+                error.append(err)
+                gain.append(g)
+                delay.append(d)
+
+            elapsed = time.perf_counter()-start
+
+            point = {
+                'amplitude'     : amplitude,
+                'decay'         : decay,
+                'rise'          : rise,
+                'incidentTime'  : args.incidentTime,
+                'triggers'      : args.repeat,
+                'missedFrames'  : missed,
+                'loadTime'      : stats(loadTime),
+                'latency'       : stats(latency),
+                'triggerRate'   : (args.repeat-missed)/elapsed if elapsed > 0 else 0.0,
+                'readbackError' : stats(error),
+                'gain'          : stats(gain),
+                'delay'         : stats(delay),
+            }
+            points.append(point)
+            print(f"A={amplitude:6d} decay={decay:.2e} rise={rise:.2e}: "
+                  f"load={point['loadTime'].get('mean',0):.2e}s "
+                  f"latency={point['latency'].get('mean',0):.2e}s "
+                  f"rate={point['triggerRate']:.1f}Hz "
+                  f"error={point['readbackError'].get('mean',0):.3f}")
+
+        result = {
+            'target'  : 'emulator' if args.emulate else args.ip,
+            'created' : time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'points'  : points,
+            'summary' : {
+                'loadTime'      : stats([p['loadTime']['mean'] for p in points if p['loadTime']]),
+                'latency'       : stats([p['latency']['mean'] for p in points if p['latency']]),
+                'triggerRate'   : stats([p['triggerRate'] for p in points]),
+                'readbackError' : stats([p['readbackError']['mean'] for p in points if p['readbackError']]),
+            },
+        }
+
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f'Wrote {args.output}')
+
+    # Non-zero exit status if any trigger was not read back
+    sys.exit(1 if any(p['missedFrames'] for p in points) else 0)
+
+    #################################################################
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import setupLibPaths
+import rfsoc_4x2_photon_detector_dev
+
+import argparse
+
+import numpy as np
+
+if __name__ == "__main__":
+
+#################################################################
+
+    # Set the argument parser
+    parser = argparse.ArgumentParser()
+
+    # Add arguments
+    parser.add_argument(
+        "--file",
+        type     = str,
+        required = True,
+        help     = "Record file written by Root.Recorder",
+    )
+
+    parser.add_argument(
+        "--event",
+        type     = int,
+        required = False,
+        default  = None,
+        help     = "Frame number to extract (default: print a summary of the file)",
+    )
+
+    parser.add_argument(
+        "--channel",
+        type     = int,
+        required = False,
+        default  = None,
+        help     = "Count --event within this channel only (ADC: 0-15, DAC: 16-31)",
+    )
+
+    parser.add_argument(
+        "--output",
+        type     = str,
+        required = False,
+        default  = None,
+        help     = "Save the extracted int16 samples to this .npy file",
+    )
+
+    # Get the arguments
+    args = parser.parse_args()
+
+    #################################################################
+
+    with rfsoc_4x2_photon_detector_dev.RecordReader(args.file) as reader:
+
+        if args.event is None:
+            for ch in reader.channels:
+                entries = reader.index[reader.index['channel'] == ch]
+                print(f'Channel {ch:2d}: {entries.size} frames, {entries["timestamp"][-1]-entries["timestamp"][0]:.3f} s')
+        else:
+            entry   = reader.entry(args.event, args.channel)
+            samples = reader.samples(args.event, args.channel)
+            print(f'Frame {entry["frame"]} (channel {entry["channel"]} frame {entry["chFrame"]}) '
+                  f'at {entry["timestamp"]:.6f}: {samples.size} samples, min={samples.min()} max={samples.max()}')
+            if args.output is not None:
+                np.save(args.output, samples)
+                print(f'Wrote {args.output}')
+
+    #################################################################
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import setupLibPaths
+import rfsoc_4x2_photon_detector_dev
+
+import time
+import argparse
+
+if __name__ == "__main__":
+
+#################################################################
+
+    # Set the argument parser
+    parser = argparse.ArgumentParser()
+
+    # Add arguments
+    parser.add_argument(
+        "--name",
+        type     = str,
+        required = False,
+        default  = 'rfsoc_adc0',
+        help     = "Shared memory ring published by Root(shmPrefix=...): <shmPrefix>_adc<i> or <shmPrefix>_dac<i>",
+    )
+
+    parser.add_argument(
+        "--copy",
+        action   = 'store_true',
+        help     = "Copy the frames out of the ring instead of using zero-copy views",
+    )
+
+    # Get the arguments
+    args = parser.parse_args()
+
+    #################################################################
+
+    with rfsoc_4x2_photon_detector_dev.SharedRingReader(args.name) as ring:
+        print(f'{ring.name}: {ring.slots} slots of {ring.slotSamples} samples at {ring.sampleRate:.4e} Hz')
+
+        count  = 0
+        missed = 0
+        last   = None
+        report = time.monotonic()+1.0
+        for n, samples, stamp in ring.follow(copy=args.copy):
+
+            # Example analysis on the frame, done before the writer can reuse its slot
+            peak = int(samples.max())-int(samples.min())
+            if not (args.copy or ring.check(n)):
+                missed += 1
+                continue
+
+            if (last is not None) and (n != last+1):
+                missed += n-last-1
+            last   = n
+            count += 1
+
+            if time.monotonic() > report:
+                print(f'frame {n}: {count} frames/s, {missed} missed, peak-to-peak {peak}, age {1E3*(time.time()-stamp):.3f} ms')
+                count  = 0
+                missed = 0
+                report = time.monotonic()+1.0
+
+    #################################################################
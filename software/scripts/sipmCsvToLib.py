@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the 'rfsoc-4x2-photon-detector-dev'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'rfsoc-4x2-photon-detector-dev', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import setupLibPaths
+import rfsoc_4x2_photon_detector_dev
+
+import argparse
+
+if __name__ == "__main__":
+
+#################################################################
+
+    # Set the argument parser
+    parser = argparse.ArgumentParser()
+
+    # Add arguments
+    parser.add_argument(
+        "--csv",
+        type     = str,
+        required = False,
+        default  = 'config/SipmWave8GSPS.csv',
+        help     = "Input CSV file with one SiPM waveform per row",
+    )
+
+    parser.add_argument(
+        "--lib",
+        type     = str,
+        required = False,
+        default  = 'config/SipmWave8GSPS.wlib',
+        help     = "Output binary SiPM waveform library file",
+    )
+
+    parser.add_argument(
+        "--sampleRate",
+        type     = float,
+        required = False,
+        default  = 8.128E+9,
+        help     = "Sample rate of the waveforms (units of Hz)",
+    )
+
+    # Get the arguments
+    args = parser.parse_args()
+
+    #################################################################
+
+    lib = rfsoc_4x2_photon_detector_dev.WaveformLibrary.fromCsv(
+        csvPath    = args.csv,
+        path       = args.lib,
+        sampleRate = args.sampleRate,
+    )
+    print(f'Wrote {len(lib)} waveforms x {lib.recordLength} samples to {lib.path}')
+
+    #################################################################